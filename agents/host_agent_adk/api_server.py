@@ -16,8 +16,14 @@ from fastapi.responses import StreamingResponse, JSONResponse
 from pydantic import BaseModel
 import uvicorn
 from dotenv import load_dotenv
+from spark_db.changes import ChangeFeed, change_feed_enabled
+from spark_db.deadline import deadline, request_deadline_seconds
+from spark_db.metrics import registry as db_metrics_registry
+from spark_db.repository import get_repository
+from spark_db.write_behind import get_flag_writer
 
 from host.agent import HostAgent, RECONCILER_AGENT_URL
+from host.tools.model_registry import get_model_registry
 
 load_dotenv()
 
@@ -31,8 +37,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Database work for one chat request must finish within this budget, inside
+# the frontend's 30 second request timeout
+CHAT_DEADLINE_SECONDS = request_deadline_seconds(25)
+
 host_agent: Optional[HostAgent] = None
 sessions: Dict[str, Dict[str, Any]] = {}
+change_feed = ChangeFeed(get_repository())
 
 
 class ChatRequest(BaseModel):
@@ -56,6 +67,22 @@ async def startup_event():
     global host_agent
     print("Initializing SPARK Host Agent API Server...")
     
+    # Open the database (pool and migrations for Postgres) on the server's loop
+    # before the first chat needs it
+    await get_repository().prepare()
+    
+    # Pick up transaction changes (settlements, retries) as they are committed
+    if change_feed_enabled():
+        await change_feed.start()
+    
+    # Load and warm up the TRYBE models before reporting the server online
+    try:
+        await asyncio.to_thread(get_model_registry().load_all)
+        print("[OK] TRYBE models loaded")
+    except Exception as e:
+        print(f"[ERROR] Failed to load TRYBE models: {e}")
+        print("  Note: Models will be loaded on first use instead")
+    
     remote_agent_urls = [RECONCILER_AGENT_URL]
     
     try:
@@ -67,17 +94,35 @@ async def startup_event():
         print("  Note: The server will still start but some features may be limited")
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Write queued flags, stop the change feed and release database connections on server shutdown."""
+    await get_flag_writer().close()
+    await change_feed.stop()
+    await get_repository().close()
+
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint."""
     return {
-        "status": "online" if host_agent else "initializing",
+        "status": "online" if host_agent and get_model_registry().ready else "initializing",
         "timestamp": datetime.now().isoformat(),
         "agent": "SPARK_Host_Agent",
-        "connected_agents": list(host_agent.remote_agent_connections.keys()) if host_agent else []
+        "connected_agents": list(host_agent.remote_agent_connections.keys()) if host_agent else [],
+        "transaction_cache": get_repository().cache_stats(),
+        "change_feed": change_feed.stats(),
+        "flag_writes": get_flag_writer().stats(),
+        "models": get_model_registry().stats()
     }
 
 
+@app.get("/metrics/db")
+async def db_metrics():
+    """Per-query database latency, rows, pool wait and slow-query samples."""
+    return db_metrics_registry.snapshot()
+
+
 @app.post("/chat")
 async def chat(request: ChatRequest):
     """
@@ -106,16 +151,17 @@ async def chat(request: ChatRequest):
         
         # Process through host agent
         response_text = ""
-        async for event in host_agent.stream(
-            query=request.message,
-            session_id=request.session_id
-        ):
-            if event.get("is_task_complete"):
-                response_text = event.get("content", "")
-                break
-            else:
-                # For non-streaming response, we just collect updates
-                print(f"[API] Processing: {event.get('updates', '')}")
+        with deadline(CHAT_DEADLINE_SECONDS):
+            async for event in host_agent.stream(
+                query=request.message,
+                session_id=request.session_id
+            ):
+                if event.get("is_task_complete"):
+                    response_text = event.get("content", "")
+                    break
+                else:
+                    # For non-streaming response, we just collect updates
+                    print(f"[API] Processing: {event.get('updates', '')}")
         
         # Store agent response
         sessions[request.session_id]["messages"].append({
@@ -167,46 +213,47 @@ async def chat_stream(request: ChatRequest):
             flagged_transactions = False
             consulting_agents = False
             
-            async for event in host_agent.stream( # type: ignore
-                query=request.message,
-                session_id=request.session_id
-            ):
-                if event.get("is_task_complete"):
-                    response_text = event.get('content', '')
+            with deadline(CHAT_DEADLINE_SECONDS):
+                async for event in host_agent.stream( # type: ignore
+                    query=request.message,
+                    session_id=request.session_id
+                ):
+                    if event.get("is_task_complete"):
+                        response_text = event.get('content', '')
                     
-                    # Send final response
-                    yield f"data: {json.dumps({'type': 'complete', 'content': response_text, 'timestamp': time.time()})}\n\n"
-                    yield "data: [DONE]\n\n"
-                    break
-                else:
-                    updates = event.get('updates', '')
+                        # Send final response
+                        yield f"data: {json.dumps({'type': 'complete', 'content': response_text, 'timestamp': time.time()})}\n\n"
+                        yield "data: [DONE]\n\n"
+                        break
+                    else:
+                        updates = event.get('updates', '')
                     
-                    # Parse updates to provide specific status messages
-                    if 'consulting with bpi specialist' in updates.lower():
-                        yield f"data: {json.dumps({'type': 'status', 'content': 'Consulting with BPI specialist agents...', 'timestamp': time.time()})}\n\n"
-                        await asyncio.sleep(0.3)
-                    elif 'connected to reconciler' in updates.lower():
-                        yield f"data: {json.dumps({'type': 'status', 'content': 'Connected to transaction reconciliation specialist...', 'timestamp': time.time()})}\n\n"
-                        await asyncio.sleep(0.2)
-                    elif 'checking transaction patterns' in updates.lower():
-                        yield f"data: {json.dumps({'type': 'status', 'content': 'Checking transaction patterns...', 'timestamp': time.time()})}\n\n"
-                        await asyncio.sleep(0.3)
-                    elif 'evaluating for anomalies' in updates.lower():
-                        yield f"data: {json.dumps({'type': 'status', 'content': 'Evaluating for anomalies...', 'timestamp': time.time()})}\n\n"
-                        await asyncio.sleep(0.3)
-                    elif 'analyzing' in updates.lower():
-                        yield f"data: {json.dumps({'type': 'status', 'content': 'Analyzing transaction details...', 'timestamp': time.time()})}\n\n"
-                    elif 'flagged' in updates.lower() and not flagged_transactions:
-                        flagged_transactions = True
-                        yield f"data: {json.dumps({'type': 'status', 'content': 'Detected potential issues in transactions...', 'timestamp': time.time()})}\n\n"
-                        await asyncio.sleep(0.3)
-                        yield f"data: {json.dumps({'type': 'status', 'content': 'Preparing resolution strategy...', 'timestamp': time.time()})}\n\n"
-                    elif 'retry' in updates.lower():
-                        yield f"data: {json.dumps({'type': 'status', 'content': 'Initiating transaction retry process...', 'timestamp': time.time()})}\n\n"
-                    elif 'report' in updates.lower():
-                        yield f"data: {json.dumps({'type': 'status', 'content': 'Generating detailed report...', 'timestamp': time.time()})}\n\n"
+                        # Parse updates to provide specific status messages
+                        if 'consulting with bpi specialist' in updates.lower():
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Consulting with BPI specialist agents...', 'timestamp': time.time()})}\n\n"
+                            await asyncio.sleep(0.3)
+                        elif 'connected to reconciler' in updates.lower():
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Connected to transaction reconciliation specialist...', 'timestamp': time.time()})}\n\n"
+                            await asyncio.sleep(0.2)
+                        elif 'checking transaction patterns' in updates.lower():
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Checking transaction patterns...', 'timestamp': time.time()})}\n\n"
+                            await asyncio.sleep(0.3)
+                        elif 'evaluating for anomalies' in updates.lower():
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Evaluating for anomalies...', 'timestamp': time.time()})}\n\n"
+                            await asyncio.sleep(0.3)
+                        elif 'analyzing' in updates.lower():
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Analyzing transaction details...', 'timestamp': time.time()})}\n\n"
+                        elif 'flagged' in updates.lower() and not flagged_transactions:
+                            flagged_transactions = True
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Detected potential issues in transactions...', 'timestamp': time.time()})}\n\n"
+                            await asyncio.sleep(0.3)
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Preparing resolution strategy...', 'timestamp': time.time()})}\n\n"
+                        elif 'retry' in updates.lower():
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Initiating transaction retry process...', 'timestamp': time.time()})}\n\n"
+                        elif 'report' in updates.lower():
+                            yield f"data: {json.dumps({'type': 'status', 'content': 'Generating detailed report...', 'timestamp': time.time()})}\n\n"
                     
-                    print(f"[API] Stream update: {updates}")
+                        print(f"[API] Stream update: {updates}")
                     
         except Exception as e:
             print(f"[API] Stream error: {e}")
@@ -241,14 +288,15 @@ async def trigger_discrepancy(transaction_id: str):
             "transaction_id": transaction_id
         }
         
-        async for event in host_agent.stream(
-            query="",  # Empty query, the agent will handle the proactive message
-            session_id=session_id,
-            metadata=metadata
-        ):
-            if event.get("is_task_complete"):
-                response_text = event.get("content", "")
-                break
+        with deadline(CHAT_DEADLINE_SECONDS):
+            async for event in host_agent.stream(
+                query="",  # Empty query, the agent will handle the proactive message
+                session_id=session_id,
+                metadata=metadata
+            ):
+                if event.get("is_task_complete"):
+                    response_text = event.get("content", "")
+                    break
         
         return {
             "session_id": session_id,
@@ -270,6 +318,41 @@ async def get_session(session_id: str):
     return sessions[session_id]
 
 
+@app.get("/sessions/{session_id}/events")
+async def session_events(session_id: str):
+    """
+    Stream changes to the session user's transactions as Server-Sent Events.
+    Replaces polling: settlements and retries arrive as soon as they are committed.
+    """
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    
+    user_id = sessions[session_id]["user_id"]
+    
+    async def generate() -> AsyncGenerator[str, None]:
+        queue = change_feed.subscribe(user_id)
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    # Keep idle connections from being closed by proxies
+                    yield ": keepalive\n\n"
+                    continue
+                yield f"data: {json.dumps({'type': 'transaction_update', 'content': event, 'timestamp': time.time()})}\n\n"
+        finally:
+            change_feed.unsubscribe(user_id, queue)
+    
+    return StreamingResponse(
+        generate(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+        }
+    )
+
+
 @app.delete("/sessions/{session_id}")
 async def clear_session(session_id: str):
     """Clear a specific session."""
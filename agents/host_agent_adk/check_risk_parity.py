@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+"""
+Parity check for the risk predictor's scoring paths.
+
+``predict_risk`` scores a dict with the compiled ``_FeaturePlan`` (plain
+Python plus a hand-rolled random forest ``predict_proba``), and a DataFrame
+with ``preprocess`` and scikit-learn. ``score_user_transactions`` scores a
+user's transactions as one DataFrame batch. All three must give the same
+score for the same transaction, including ones with None values, unseen
+categories and missing columns. The plan reads scikit-learn's tree arrays
+directly, so run this after upgrading scikit-learn, pandas or the model.
+
+Usage:
+    uv run python check_risk_parity.py [--rows 200] [--seed 7] [--tolerance 1e-9]
+
+Loads the risk predictor with the same model registry as the API server and
+exits non-zero when any two paths disagree by more than the tolerance. ``tools``
+is imported as a package of its own: importing the ``host`` package would
+build the host agent and fetch the remote agent cards.
+"""
+
+import argparse
+import os
+import random
+import sys
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "host"))
+
+from tools.model_registry import WARMUP_TRANSACTION, ModelRegistry
+
+# Columns that identify a transaction rather than describe it
+_ID_COLUMNS = ("transaction_id", "user_id")
+
+
+def _variant(name: str, change: Callable[[Dict[str, Any]], None]) -> Tuple[str, Dict[str, Any]]:
+    transaction = dict(WARMUP_TRANSACTION, transaction_id=f"PARITY_{name}")
+    change(transaction)
+    return name, transaction
+
+
+def full_cases() -> List[Tuple[str, Dict[str, Any]]]:
+    """Edge cases with every column present, as database rows have them."""
+    cases = [_variant("complete", lambda t: None)]
+    for column in WARMUP_TRANSACTION:
+        if column not in _ID_COLUMNS:
+            cases.append(_variant(f"{column}=None", lambda t, c=column: t.update({c: None})))
+    cases += [
+        _variant("unseen transaction_type", lambda t: t.update(transaction_type="Carrier Pigeon")),
+        _variant("unseen recipient_type", lambda t: t.update(recipient_type="Stranger")),
+        _variant("unseen recipient bank",
+                 lambda t: t.update(recipient_bank_name_or_ewallet="Bank of Atlantis")),
+        _variant("amount as text", lambda t: t.update(amount="2500.75")),
+        _variant("latency as text", lambda t: t.update(simulated_network_latency="900")),
+        _variant("fraud None, escalation True",
+                 lambda t: t.update(is_fraudulent_attempt=None, manual_escalation_needed=True)),
+        _variant("fraud True, escalation None",
+                 lambda t: t.update(is_fraudulent_attempt=True, manual_escalation_needed=None)),
+        _variant("unparseable timestamp", lambda t: t.update(timestamp_initiated="not a time")),
+        _variant("weekend", lambda t: t.update(timestamp_initiated="2024-05-11 09:15:00")),
+        # Postgres writes as many fraction digits as the value needs, so one
+        # batch mixes these formats
+        _variant("fraction of 5 digits",
+                 lambda t: t.update(timestamp_initiated="2024-05-07T10:00:00.12345")),
+        _variant("no fraction", lambda t: t.update(timestamp_initiated="2024-05-07T23:10:00")),
+        _variant("fraction of 1 digit",
+                 lambda t: t.update(timestamp_initiated="2024-05-07 19:40:48.1")),
+        _variant("date only", lambda t: t.update(timestamp_initiated="2024-05-12")),
+        _variant("everything None", lambda t: t.update(
+            {c: None for c in WARMUP_TRANSACTION if c not in _ID_COLUMNS}
+        )),
+    ]
+    return cases
+
+
+def partial_cases() -> List[Tuple[str, Dict[str, Any]]]:
+    """Edge cases with columns missing or under an alias; scored one at a time."""
+    cases = []
+    for column in WARMUP_TRANSACTION:
+        if column not in _ID_COLUMNS:
+            cases.append(_variant(f"no {column}", lambda t, c=column: t.pop(c)))
+    cases += [
+        _variant("aliases", lambda t: t.update(
+            txn_amount=t.pop("amount"), latency_ms=t.pop("simulated_network_latency"),
+            fraud_flag=t.pop("is_fraudulent_attempt"), escalate=t.pop("manual_escalation_needed")
+        )),
+        _variant("only an amount", lambda t: [t.pop(c) for c in list(t) if c != "amount"]),
+    ]
+    return cases
+
+
+def random_cases(predictor: Any, rows: int, seed: int) -> List[Tuple[str, Dict[str, Any]]]:
+    """Transactions drawn from the model's vocabularies, with some values None."""
+    rng = random.Random(seed)
+    vocabularies = {
+        col: list(predictor._vocabulary(col)) for col in predictor.CATEGORICAL_COLS
+        if col in predictor.label_encoders
+    }
+    cases = []
+    for i in range(rows):
+        transaction = dict(
+            WARMUP_TRANSACTION,
+            transaction_id=f"PARITY_RANDOM_{i}",
+            amount=round(rng.lognormvariate(7, 1.5), 2),
+            simulated_network_latency=rng.randint(50, 3000),
+            floating_duration_minutes=rng.choice([0, 5, 15, 60, 240]),
+            is_fraudulent_attempt=rng.random() < 0.1,
+            is_cancellation=rng.random() < 0.1,
+            manual_escalation_needed=rng.random() < 0.1,
+            timestamp_initiated=f"2024-05-{rng.randint(1, 28):02d} "
+                                f"{rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}:00",
+        )
+        for col, vocabulary in vocabularies.items():
+            transaction[col] = rng.choice(vocabulary)
+        for col in rng.sample(sorted(transaction), 2):
+            if col not in _ID_COLUMNS:
+                transaction[col] = None
+        cases.append((f"random {i}", transaction))
+    return cases
+
+
+def check(rows: int = 200, seed: int = 7, tolerance: float = 1e-9) -> List[str]:
+    """
+    Score every case through each path and compare.
+
+    Returns:
+        One line per disagreement; empty when all paths agree
+    """
+    predictor = ModelRegistry().get("risk_predictor")
+    failures = []
+
+    def score(label: str, name: str, transaction: Any) -> Any:
+        try:
+            return predictor.predict_risk(transaction)
+        except Exception as e:
+            failures.append(f"{label:16} {name}: raised {type(e).__name__}: {e}")
+            return None
+
+    def compare(label: str, name: str, expected: float, actual: float) -> None:
+        if not abs(expected - actual) <= tolerance:
+            failures.append(f"{label:16} {name}: dict {expected:.12f}, other {actual:.12f}")
+
+    full = full_cases() + random_cases(predictor, rows, seed)
+    partial = partial_cases()
+    single = {}
+    for name, transaction in full + partial:
+        single[name] = score("dict", name, dict(transaction))
+        one_row = score("one-row frame", name, pd.DataFrame([transaction]))
+        if single[name] is not None and one_row is not None:
+            compare("one-row frame", name, single[name], float(one_row))
+
+    # One call over the whole batch, as score_user_transactions does
+    batch = score("batch", f"{len(full)} transactions", pd.DataFrame([t for _, t in full]))
+    if batch is not None:
+        for (name, _), value in zip(full, np.atleast_1d(batch)):
+            if single[name] is not None:
+                compare("batch", name, single[name], float(value))
+
+    print(f"Compared {len(full) + len(partial)} transactions as dicts and one-row frames, "
+          f"and {len(full)} of them in one batch")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that all risk scoring paths agree")
+    parser.add_argument("--rows", type=int, default=200, help="Random transactions to add")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--tolerance", type=float, default=1e-9)
+    args = parser.parse_args()
+
+    failures = check(args.rows, args.seed, args.tolerance)
+    for line in failures:
+        print(line)
+    if failures:
+        raise SystemExit(f"FAILED: {len(failures)} scores differ between paths or raised")
+    print("OK")
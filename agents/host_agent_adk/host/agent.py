@@ -5,7 +5,6 @@ from datetime import datetime
 from typing import Any, AsyncIterable, List, Optional, Dict
 
 import httpx
-import nest_asyncio
 from a2a.client import A2ACardResolver
 from a2a.types import (
     AgentCard,
@@ -24,13 +23,15 @@ from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
 from google.adk.tools.tool_context import ToolContext
 from google.genai import types
+from spark_db.deadline import remaining
+from spark_db.repository import get_repository
+from spark_db.write_behind import get_flag_writer
 
-from .tools.database_tools import query_user_transactions, run_discrepancy_check, DUMMY_USER_ID
+from .tools.database_tools import query_user_transactions, run_discrepancy_check, score_user_transactions, get_user_transaction, DUMMY_USER_ID
 from .remote_agent_connection import RemoteAgentConnections
 from .prompt import get_spark_prompt
 
 load_dotenv()
-nest_asyncio.apply()
 
 # Remote agent URL
 RECONCILER_AGENT_URL = "http://localhost:8081"  # Reconciler Agent
@@ -108,6 +109,7 @@ class HostAgent:
             tools=[
                 query_user_transactions,
                 run_discrepancy_check,
+                score_user_transactions,
                 self.send_message_to_remote_agent,
                 self.get_transaction_status,
             ],
@@ -275,14 +277,25 @@ class HostAgent:
                 "contextId": context_id,
             },
         }
+        # Hand the rest of this request's database budget to the remote agent
+        deadline_seconds = remaining()
+        if deadline_seconds is not None:
+            payload["message"]["metadata"] = {"deadline_seconds": deadline_seconds}
 
         message_request = SendMessageRequest(
             id=message_id, params=MessageSendParams.model_validate(payload)
         )
         
         try:
+            # The reconciler reads the floating cash flags, so write any still queued
+            await get_flag_writer().flush()
+            
             send_response: SendMessageResponse = await client.send_message(message_request)
             
+            # The remote agent may have retried or escalated this user's
+            # transactions, so drop the host's cached reads of them
+            get_repository().invalidate(user_id=self._user_id)
+            
             print(f"DEBUG: Received response from {agent_name}: {send_response}")
             
             if not isinstance(
@@ -357,21 +370,16 @@ class HostAgent:
         tool_context: ToolContext
     ) -> Dict[str, Any]:
         """Get the current status of a transaction."""
-        # Query the transaction from database (now synchronous)
-        transactions = query_user_transactions(
-            user_id=self._user_id,
-            limit=100,
-            tool_context=tool_context
-        )
+        # Look the transaction up by key for the sandboxed user
+        txn = await get_user_transaction(self._user_id, transaction_id)
         
-        for txn in transactions:
-            if txn['transaction_id'] == transaction_id:
-                return {
-                    "found": True,
-                    "transaction": txn,
-                    "is_floating_cash": txn.get('is_floating_cash', False),
-                    "status": "resolved" if not txn.get('is_floating_cash') else "pending_resolution"
-                }
+        if txn:
+            return {
+                "found": True,
+                "transaction": txn,
+                "is_floating_cash": txn.get('is_floating_cash', False),
+                "status": "resolved" if not txn.get('is_floating_cash') else "pending_resolution"
+            }
         
         return {
             "found": False,
@@ -1,175 +1,141 @@
-import os
-import asyncio
-import asyncpg
 import random
+import numpy as np
 import pandas as pd
-from decimal import Decimal
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
 from google.adk.tools.tool_context import ToolContext
 from dotenv import load_dotenv
+from spark_db.deadline import TIMEOUT_ERRORS, timed_out_result
+from spark_db.repository import get_repository
+from spark_db.status_events import current_status
+from spark_db.write_behind import get_flag_writer
+from .model_registry import get_model, get_model_registry
 from .trybe_models import TRYBEDiscrepancyDetector
-try:
-    import nest_asyncio
-except ImportError:
-    nest_asyncio = None
 
 load_dotenv()
 
-# Create an instance of the detector directly instead of loading from pickle
-# The pickle file has module path issues, so we instantiate directly
-detector = TRYBEDiscrepancyDetector()
-
 # Global constant for development
 DUMMY_USER_ID = "user_1"
 
+# Page size when the caller gives no limit, and the most one page may hold
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
 
-def convert_to_json_serializable(value: Any) -> Any:
-    """
-    Convert PostgreSQL/Python types to JSON-serializable formats.
-    
-    Args:
-        value: The value to convert
-    
-    Returns:
-        JSON-serializable version of the value
-    """
-    # Handle Decimal type
-    if isinstance(value, Decimal):
-        # Convert to float for JSON serialization
-        # Use string if you need exact precision
-        return float(value)
-    
-    # Handle datetime objects
-    if hasattr(value, 'isoformat'):
-        return value.isoformat()
-    
-    # Handle bytes
-    if isinstance(value, bytes):
-        return value.decode('utf-8', errors='ignore')
-    
-    # Handle other potential PostgreSQL types
-    if value is None:
-        return None
-    
-    # Return as-is for standard JSON-serializable types
-    return value
+# Riskiest transactions returned by score_user_transactions by default, and at most
+DEFAULT_TOP_K = 5
+MAX_TOP_K = 20
+
+# Risk score at or above which a transaction is reported as high / medium risk
+HIGH_RISK_SCORE = 0.7
+MEDIUM_RISK_SCORE = 0.4
+
+# Network latency (ms) the risk model treats as high (its is_high_latency feature)
+HIGH_LATENCY_MS = 1000
 
-def query_user_transactions(
+# A current status containing any of these means the transfer has finished
+COMPLETED_STATUS_MARKERS = ("credit confirmed", "settled", "reversal")
+
+
+async def query_user_transactions(
     user_id: str,
     limit: Optional[int] = None,
+    cursor: Optional[str] = None,
     tool_context: Optional[ToolContext] = None
-) -> List[Dict[str, Any]]:
+) -> Dict[str, Any]:
     """
-    Query transactions for a specific user from the database.
+    Query one page of transactions for a specific user, newest first.
     CRITICALLY SANDBOXED: Can ONLY query transactions where user_id matches the provided user_id.
     
     Args:
         user_id: The user ID to query transactions for
-        limit: Optional limit on number of transactions to return
+        limit: Optional page size (default 50, at most 500)
+        cursor: Optional next_cursor from a previous call, to fetch older transactions
         tool_context: The tool context from ADK
     
     Returns:
-        List of transaction dictionaries
+        Dictionary with the page's transactions and next_cursor (None when there are no more),
+        or status "timed_out" if the database did not answer in time
     """
     
     # CRITICAL SECURITY CHECK: Ensure we only query for the authorized user
     if not user_id:
         raise ValueError("User ID is required for transaction queries")
     
-    # Get database credentials from environment
-    db_config = {
-        'database': os.getenv('DB_NAME'),
-        'host': os.getenv('DB_HOST'),
-        'port': int(os.getenv('DB_PORT', 5432)),
-        'user': os.getenv('DB_USER'),
-        'password': os.getenv('DB_PASSWORD')
-    }
+    page_size = min(max(int(limit or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
     
-    # Run the async function synchronously
-    async def _async_query():
-        try:
-            # Create connection
-            conn = await asyncpg.connect(**db_config)
-            
-            # Build the query - STRICTLY filtered by user_id
-            query = """
-                SELECT 
-                    transaction_id,
-                    user_id,
-                    amount,
-                    transaction_type,
-                    recipient_type,
-                    recipient_account_id,
-                    recipient_bank_name_or_ewallet,
-                    device_id,
-                    location_coordinates,
-                    timestamp_initiated,
-                    status_1,
-                    status_timestamp_1,
-                    status_2,
-                    status_timestamp_2,
-                    status_3,
-                    status_timestamp_3,
-                    status_4,
-                    status_timestamp_4,
-                    expected_completion_time,
-                    simulated_network_latency,
-                    is_floating_cash,
-                    floating_duration_minutes,
-                    is_fraudulent_attempt,
-                    is_cancellation,
-                    is_retry_successful,
-                    manual_escalation_needed
-                FROM transactions
-                WHERE user_id = $1
-                ORDER BY timestamp_initiated DESC
-            """
-            
-            if limit:
-                query += f" LIMIT {limit}"
-            
-            # Execute query with user_id parameter
-            rows = await conn.fetch(query, user_id)
-            
-            # Convert rows to dictionaries
-            transactions = []
-            for row in rows:
-                transaction = {}
-                # Convert all values to JSON-serializable formats
-                for key, value in dict(row).items():
-                    transaction[key] = convert_to_json_serializable(value)
-                transactions.append(transaction)
-            
-            await conn.close()
-            
-            return transactions
-            
-        except Exception as e:
-            print(f"Database query error: {str(e)}")
-            raise Exception(f"Failed to query transactions: {str(e)}")
-    
-    # Execute the async function
     try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # If there's already a running loop, use nest_asyncio if available
-            if nest_asyncio:
-                nest_asyncio.apply()
-                return asyncio.run(_async_query())
-            else:
-                # Create a new thread to run the async function
-                import concurrent.futures
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(asyncio.run, _async_query())
-                    return future.result()
-        else:
-            return loop.run_until_complete(_async_query())
-    except RuntimeError:
-        # Fallback for when no event loop exists
-        return asyncio.run(_async_query())
+        # Keyset page STRICTLY filtered by user_id
+        rows, next_cursor = await get_repository().list_user_transactions(
+            user_id, page_size, cursor
+        )
+        
+        # Pooled connections decode rows to JSON-serializable values already
+        return {
+            "transactions": rows,
+            "next_cursor": next_cursor
+        }
+        
+    except TIMEOUT_ERRORS:
+        return timed_out_result("Querying transactions", transactions=[], next_cursor=cursor)
+    except Exception as e:
+        print(f"Database query error: {str(e)}")
+        raise Exception(f"Failed to query transactions: {str(e)}")
+
+
+async def stream_user_transactions(user_id: str) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Iterate over a user's entire transaction history, newest first.
+    
+    Backed by a server-side cursor, so memory stays flat however many
+    transactions the user has.
+    
+    Args:
+        user_id: The user ID to stream transactions for
+    
+    Yields:
+        JSON-serializable transaction dictionaries
+    """
+    if not user_id:
+        raise ValueError("User ID is required for transaction queries")
+    
+    async for row in get_repository().stream_user_transactions(user_id):
+        yield row
+
+
+async def get_user_transaction(user_id: str, transaction_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Fetch a single transaction by ID, restricted to the given user.
+    
+    Args:
+        user_id: The user the transaction must belong to
+        transaction_id: The transaction ID to fetch
+    
+    Returns:
+        JSON-serializable transaction dictionary, or None if not found
+    """
+    if not user_id:
+        raise ValueError("User ID is required for transaction queries")
+    
+    return await get_repository().get_transaction(transaction_id, user_id)
+
+
+async def get_user_transactions_by_id(user_id: str, transaction_ids: List[str]) -> List[Dict[str, Any]]:
+    """
+    Fetch several transactions by ID in one query, restricted to the given user.
+    
+    Args:
+        user_id: The user the transactions must belong to
+        transaction_ids: Transaction IDs to fetch
+    
+    Returns:
+        JSON-serializable transaction dictionaries for the IDs that were found
+    """
+    if not user_id:
+        raise ValueError("User ID is required for transaction queries")
+    
+    return await get_repository().get_transactions(transaction_ids, user_id)
 
 
-def run_discrepancy_check(
+async def run_discrepancy_check(
     transaction_id: str,
     tool_context: Optional[ToolContext] = None
 ) -> Dict[str, Any]:
@@ -189,15 +155,15 @@ def run_discrepancy_check(
     if tool_context and hasattr(tool_context, 'state'):
         user_id = tool_context.state.get('user_id', DUMMY_USER_ID)
     
-    # First, fetch the transaction details using the sandboxed query
-    transactions = query_user_transactions(user_id, limit=100, tool_context=tool_context)
-    
-    # Find the specific transaction
-    transaction = None
-    for txn in transactions:
-        if txn['transaction_id'] == transaction_id:
-            transaction = txn
-            break
+    # First, fetch the transaction by key, scoped to the sandboxed user
+    try:
+        transaction = await get_user_transaction(user_id, transaction_id)
+    except TIMEOUT_ERRORS:
+        return timed_out_result(
+            f"Fetching transaction {transaction_id}",
+            transaction_id=transaction_id,
+            is_floating_cash=False
+        )
     
     if not transaction:
         return {
@@ -212,12 +178,13 @@ def run_discrepancy_check(
         'user_id': transaction['user_id'],
         'amount': float(transaction['amount']) if transaction.get('amount') else 0.0,
         'transaction_type': transaction.get('transaction_type', 'Unknown'),
-        'status_4': transaction.get('status_4', transaction.get('status_1', 'Unknown')),
+        'status_4': current_status(transaction) or 'Unknown',
         'floating_duration_minutes': transaction.get('floating_duration_minutes', 0),
         'manual_escalation_needed': transaction.get('manual_escalation_needed', False)
     }])
     
-    # Run ML model detection
+    # Run ML model detection (loaded once per process by the model registry)
+    detector = get_model("discrepancy_detector")
     result = detector.detect_discrepancies(transaction_df)
     is_discrepancy = bool(result['detected_discrepancy'].iloc[0])
     
@@ -232,7 +199,7 @@ def run_discrepancy_check(
             discrepancy_reasons.append(f"Transaction has been floating for {floating_duration} minutes (exceeds {detector._THRESHOLD_MIN} min threshold)")
         
         # Check status for additional context
-        status = transaction.get('status_4', transaction.get('status_1', '')).lower()
+        status = (current_status(transaction) or '').lower()
         if 'failed' in status:
             discrepancy_reasons.append(f"Transaction status indicates failure: {status}")
         elif 'timeout' in status:
@@ -256,59 +223,12 @@ def run_discrepancy_check(
     
     # If discrepancy detected, update the database
     if is_discrepancy:
-        async def _async_update():
-            try:
-                db_config = {
-                    'database': os.getenv('DB_NAME'),
-                    'host': os.getenv('DB_HOST'),
-                    'port': int(os.getenv('DB_PORT', 5432)),
-                    'user': os.getenv('DB_USER'),
-                    'password': os.getenv('DB_PASSWORD')
-                }
-                
-                conn = await asyncpg.connect(**db_config)
-                
-                # Update the transaction's floating cash status
-                update_query = """
-                    UPDATE transactions 
-                    SET is_floating_cash = $1,
-                        floating_duration_minutes = $2
-                    WHERE transaction_id = $3 AND user_id = $4
-                """
-                
-                # Use actual floating duration if available, otherwise simulate
-                floating_duration = transaction.get('floating_duration_minutes', random.randint(5, 120))
-                
-                await conn.execute(
-                    update_query, 
-                    True, 
-                    floating_duration,
-                    transaction_id,
-                    user_id
-                )
-                
-                await conn.close()
-                
-            except Exception as e:
-                print(f"Failed to update transaction status: {str(e)}")
+        # Use actual floating duration if available, otherwise simulate
+        floating_duration = transaction.get('floating_duration_minutes', random.randint(5, 120))
         
-        # Execute the async update
-        try:
-            loop = asyncio.get_event_loop()
-            if loop.is_running():
-                if nest_asyncio:
-                    nest_asyncio.apply()
-                    asyncio.run(_async_update())
-                else:
-                    # Create a new thread to run the async function
-                    import concurrent.futures
-                    with concurrent.futures.ThreadPoolExecutor() as executor:
-                        future = executor.submit(asyncio.run, _async_update())
-                        future.result()
-            else:
-                loop.run_until_complete(_async_update())
-        except RuntimeError:
-            asyncio.run(_async_update())
+        # Queue the floating cash flag; it is written in the next batch so the
+        # verdict does not wait on the update
+        get_flag_writer().submit(transaction_id, user_id, floating_duration)
     
     # Return the detection result with detailed analysis
     return {
@@ -319,11 +239,11 @@ def run_discrepancy_check(
         "confidence": confidence,
         "detection_method": "ml_model",
         "transaction_details": {
-            "amount": convert_to_json_serializable(transaction['amount']),
+            "amount": transaction['amount'],
             "type": transaction['transaction_type'],
             "recipient": transaction['recipient_account_id'],
             "timestamp": transaction['timestamp_initiated'],
-            "current_status": transaction.get('status_4', transaction.get('status_1', 'unknown')),
+            "current_status": current_status(transaction) or 'unknown',
             "is_floating_cash_flag": transaction.get('is_floating_cash', False),
             "floating_duration_minutes": transaction.get('floating_duration_minutes', 0)
         },
@@ -333,4 +253,134 @@ def run_discrepancy_check(
             "threshold_used": detector._THRESHOLD_MIN,
             "model_type": "TRYBE Discrepancy Detector (Rule-based with 10 min threshold)"
         }
-    }
\ No newline at end of file
+    }
+
+
+def _is_in_flight(transaction: Dict[str, Any]) -> bool:
+    """Whether a transaction has not reached a completed status yet."""
+    status = (current_status(transaction) or '').lower()
+    return not any(marker in status for marker in COMPLETED_STATUS_MARKERS)
+
+
+def _risk_reasons(transaction: Dict[str, Any], predictor) -> List[str]:
+    """Plain-language reasons behind a transaction's risk score, from the model's inputs."""
+    reasons = []
+    stats = predictor.feature_stats
+    
+    amount = transaction.get('amount')
+    if amount is not None and stats is not None and stats.high_amount_threshold is not None:
+        if float(amount) > stats.high_amount_threshold:
+            reasons.append(f"High amount ({float(amount):,.2f}, above the usual {stats.high_amount_threshold:,.2f})")
+    
+    latency = transaction.get('simulated_network_latency')
+    if latency is not None and float(latency) > HIGH_LATENCY_MS:
+        reasons.append(f"High network latency ({float(latency):.0f} ms)")
+    
+    floating_duration = transaction.get('floating_duration_minutes') or 0
+    if floating_duration > TRYBEDiscrepancyDetector._THRESHOLD_MIN:
+        reasons.append(f"Floating for {floating_duration} minutes")
+    
+    if transaction.get('is_fraudulent_attempt'):
+        reasons.append("Flagged as a fraudulent attempt")
+    if transaction.get('manual_escalation_needed'):
+        reasons.append("Manual escalation flag is active")
+    if transaction.get('is_cancellation'):
+        reasons.append("Transaction was cancelled")
+    
+    status = (current_status(transaction) or '').lower()
+    if 'failed' in status or 'timeout' in status:
+        reasons.append(f"Status indicates failure: {current_status(transaction)}")
+    
+    recipient = transaction.get('recipient_bank_name_or_ewallet')
+    if recipient and stats is not None:
+        if str(recipient) not in stats.vocabularies.get('recipient_bank_name_or_ewallet', [str(recipient)]):
+            reasons.append(f"Recipient bank/e-wallet not seen before: {recipient}")
+    
+    if not reasons:
+        reasons.append("No single strong indicator; score reflects the combined transaction profile")
+    return reasons
+
+
+async def score_user_transactions(
+    limit: Optional[int] = None,
+    top_k: Optional[int] = None,
+    in_flight_only: bool = False,
+    tool_context: Optional[ToolContext] = None
+) -> Dict[str, Any]:
+    """
+    Score the user's recent transactions with the TRYBE risk model and return the riskiest.
+    
+    All transactions are scored together in one model call, so use this instead of
+    calling run_discrepancy_check on each transaction when looking for the ones
+    most likely to become floating cash.
+    
+    Args:
+        limit: Optional number of most recent transactions to score (default 50, at most 500)
+        top_k: Optional number of riskiest transactions to return (default 5, at most 20)
+        in_flight_only: Only score transactions that have not completed yet
+        tool_context: The tool context from ADK
+    
+    Returns:
+        Dictionary with the top transactions by risk score, each with its risk level
+        and reasons, or status "timed_out" if the database did not answer in time
+    """
+    
+    # Get the current user_id from context or use dummy
+    user_id = DUMMY_USER_ID
+    if tool_context and hasattr(tool_context, 'state'):
+        user_id = tool_context.state.get('user_id', DUMMY_USER_ID)
+    
+    page_size = min(max(int(limit or DEFAULT_PAGE_SIZE), 1), MAX_PAGE_SIZE)
+    top_k = min(max(int(top_k or DEFAULT_TOP_K), 1), MAX_TOP_K)
+    
+    try:
+        transactions, _ = await get_repository().list_user_transactions(user_id, page_size)
+    except TIMEOUT_ERRORS:
+        return timed_out_result("Fetching transactions to score", transactions=[])
+    
+    if in_flight_only:
+        transactions = [t for t in transactions if _is_in_flight(t)]
+    
+    if not transactions:
+        return {
+            "status": "completed",
+            "user_id": user_id,
+            "scored": 0,
+            "transactions": [],
+            "message": "No in-flight transactions to score" if in_flight_only else "No transactions to score"
+        }
+    
+    # One predict_proba call over the whole batch. Scores do not depend on the
+    # batch: the model carries its training-time feature statistics, and each
+    # timestamp is parsed on its own even though Postgres drops trailing zeros
+    # from fractions (check_risk_parity.py checks this)
+    predictor = get_model("risk_predictor")
+    scores = np.atleast_1d(predictor.predict_risk(pd.DataFrame(transactions)))
+    
+    ranked = sorted(zip(scores, transactions), key=lambda pair: pair[0], reverse=True)[:top_k]
+    results = []
+    for score, transaction in ranked:
+        score = float(score)
+        results.append({
+            "transaction_id": transaction['transaction_id'],
+            "risk_score": round(score, 4),
+            "risk_level": "high" if score >= HIGH_RISK_SCORE else "medium" if score >= MEDIUM_RISK_SCORE else "low",
+            "amount": transaction.get('amount'),
+            "type": transaction.get('transaction_type'),
+            "timestamp": transaction.get('timestamp_initiated'),
+            "current_status": current_status(transaction) or 'unknown',
+            "reasons": _risk_reasons(transaction, predictor)
+        })
+    
+    model_info = get_model_registry().stats()["models"].get("risk_predictor", {})
+    return {
+        "status": "completed",
+        "user_id": user_id,
+        "scored": len(transactions),
+        "high_risk_count": int((scores >= HIGH_RISK_SCORE).sum()),
+        "transactions": results,
+        "model": {
+            "name": "TRYBE Risk Predictor",
+            "version": model_info.get("version")
+        }
+    }
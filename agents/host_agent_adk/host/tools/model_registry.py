@@ -0,0 +1,206 @@
+"""
+Registry of the TRYBE models used by the host tools.
+
+Each model pickle is loaded once per process and handed out by name. The
+notebooks pickled the model classes from ``__main__``, so loading resolves
+those classes to ``trybe_models``. Models are not shared between worker
+processes: scikit-learn copies a tree's arrays into buffers of its own when
+unpickling, so memory-mapping a cached copy saved nothing.
+
+Every model runs one inference right after loading, so the first request
+does not pay for lazy initialization. The API server loads all models
+before ``/health`` reports the server online; if that fails, the registry
+becomes ready once every model has loaded on first use. ``/health`` also
+reports each model's version, load and warmup time, and the process RSS
+under ``models``.
+"""
+
+import hashlib
+import os
+import pickle
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from . import trybe_models
+from .trybe_models import FeatureStatistics, TRYBEDiscrepancyDetector, TRYBERiskPredictor
+
+# Model name -> pickle file in TRYBE_MODELS_DIR
+MODEL_FILES = {
+    "discrepancy_detector": "trybe_discrepancy_detector.pkl",
+    "risk_predictor": "trybe_risk_predictor.pkl",
+}
+
+# Transaction scored once per model right after loading
+WARMUP_TRANSACTION = {
+    "transaction_id": "WARMUP",
+    "user_id": "user_warmup",
+    "amount": 1500.0,
+    "transaction_type": "Bank to Bank (InstaPay)",
+    "recipient_type": "Frequent Recipient",
+    "recipient_bank_name_or_ewallet": "GCash",
+    "simulated_network_latency": 1200,
+    "floating_duration_minutes": 15,
+    "is_fraudulent_attempt": False,
+    "is_cancellation": False,
+    "manual_escalation_needed": False,
+    "timestamp_initiated": "2024-05-07 19:40:48",
+    "status_4": "Processing (Recipient Bank/e-Wallet)",
+}
+
+
+class _ModelUnpickler(pickle.Unpickler):
+    """Resolves the classes the training notebooks pickled from ``__main__``."""
+
+    def find_class(self, module: str, name: str):
+        if module == "__main__" and hasattr(trybe_models, name):
+            return getattr(trybe_models, name)
+        return super().find_class(module, name)
+
+
+def _file_version(path: str) -> str:
+    """Short content hash of a model file, used as its version."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:12]
+
+
+def _rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where it cannot be read."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        # Peak rather than current RSS; kilobytes on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    except (ImportError, OSError):
+        return None
+
+
+class ModelRegistry:
+    """Loads each model once, on first use or in load_all(), and hands it out by name."""
+
+    def __init__(self, models_dir: Optional[str] = None):
+        self.models_dir = models_dir or os.getenv("TRYBE_MODELS_DIR") or os.path.dirname(
+            os.path.abspath(__file__)
+        )
+        self.ready = False
+        self._models: Dict[str, Any] = {}
+        self._info: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str) -> Any:
+        """
+        Get a model by name, loading it if this process has not yet.
+
+        Args:
+            name: One of MODEL_FILES, e.g. "risk_predictor"
+
+        Returns:
+            The loaded and warmed-up model
+        """
+        model = self._models.get(name)
+        if model is None:
+            with self._lock:
+                if name not in self._models:
+                    self._load(name)
+            model = self._models[name]
+        return model
+
+    def load_all(self) -> Dict[str, Any]:
+        """
+        Load and warm up every model, which marks the registry ready.
+
+        Returns:
+            The registry's stats()
+        """
+        for name in MODEL_FILES:
+            self.get(name)
+        return self.stats()
+
+    def stats(self) -> Dict[str, Any]:
+        """Readiness, process RSS, and version and timings of each loaded model."""
+        return {
+            "ready": self.ready,
+            "rss_bytes": _rss_bytes(),
+            "models": {name: dict(info) for name, info in self._info.items()},
+        }
+
+    def _load(self, name: str) -> None:
+        if name not in MODEL_FILES:
+            raise KeyError(f"Unknown model {name!r}; expected one of {sorted(MODEL_FILES)}")
+        path = os.path.join(self.models_dir, MODEL_FILES[name])
+
+        start = time.monotonic()
+        version = _file_version(path)
+        model = self._unpickle(path)
+        self._attach_feature_statistics(model, path)
+        loaded = time.monotonic()
+        self._warm_up(model)
+        warmed = time.monotonic()
+
+        self._models[name] = model
+        self._info[name] = {
+            "file": MODEL_FILES[name],
+            "version": version,
+            "class": type(model).__name__,
+            "load_seconds": round(loaded - start, 3),
+            "warmup_seconds": round(warmed - loaded, 3),
+            "loaded_at": datetime.now().isoformat(),
+        }
+        print(f"[Models] Loaded {name} ({version}) in {loaded - start:.2f}s, "
+              f"warmed up in {warmed - loaded:.2f}s")
+        # Ready however the models were loaded, at startup or on first use
+        self.ready = all(model_name in self._models for model_name in MODEL_FILES)
+
+    @staticmethod
+    def _unpickle(path: str) -> Any:
+        with open(path, "rb") as f:
+            return _ModelUnpickler(f).load()
+
+    @staticmethod
+    def _attach_feature_statistics(model: Any, path: str) -> None:
+        """Give a risk predictor pickled without statistics the ones saved next to it."""
+        if not isinstance(model, TRYBERiskPredictor) or model.feature_stats is not None:
+            return
+        stats_path = os.path.splitext(path)[0] + ".features.json"
+        if os.path.exists(stats_path):
+            model.use_feature_statistics(FeatureStatistics.load(stats_path))
+        else:
+            print(f"[Models] No feature statistics for {os.path.basename(path)}; "
+                  f"risk scores will use each batch's own statistics")
+
+    @staticmethod
+    def _warm_up(model: Any) -> None:
+        """Run one inference through each code path the tools use."""
+        if isinstance(model, TRYBERiskPredictor):
+            model.predict_risk(dict(WARMUP_TRANSACTION))
+            model.predict_risk(pd.DataFrame([WARMUP_TRANSACTION] * 2))
+        elif isinstance(model, TRYBEDiscrepancyDetector):
+            model.detect_discrepancies(pd.DataFrame([WARMUP_TRANSACTION]))
+
+
+_registry: Optional[ModelRegistry] = None
+
+
+def get_model_registry() -> ModelRegistry:
+    """The process-wide model registry."""
+    global _registry
+    if _registry is None:
+        _registry = ModelRegistry()
+    return _registry
+
+
+def get_model(name: str) -> Any:
+    """Shortcut for get_model_registry().get(name)."""
+    return get_model_registry().get(name)
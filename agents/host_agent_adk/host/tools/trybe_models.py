@@ -10,15 +10,27 @@ Models:
 """
 
 from __future__ import annotations
+import json
+import re
+from datetime import datetime
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Optional, Union
+from typing import Any, List, Dict, Optional, Union
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.linear_model import LogisticRegression
 from sklearn.metrics import accuracy_score, roc_auc_score, classification_report
 
 
+_FRACTION = re.compile(r"\.(\d+)")
+
+
+def _is_categorical(values: pd.Series) -> bool:
+    """Text or categorical column (object, pandas string or category dtype)."""
+    dtype = values.dtype
+    return dtype == object or isinstance(dtype, (pd.StringDtype, pd.CategoricalDtype))
+
+
 class DataSchemaAligner:
     """
     Maps alternative/legacy column names to canonical names.
@@ -65,6 +77,51 @@ class DataSchemaAligner:
         return self.aligned
 
 
+class FeatureStatistics:
+    """
+    Training-time statistics the risk features are computed with.
+    
+    Captured once by TRYBERiskPredictor.train_model() and saved with the
+    model, so inference no longer depends on the batch being scored: the
+    high-amount cutoff is the training set's 90th percentile, missing
+    values are filled with training medians, and categories are encoded
+    with the training vocabularies.
+    """
+    
+    VERSION = 1
+    
+    def __init__(self, high_amount_threshold: Optional[float],
+                 medians: Dict[str, float], vocabularies: Dict[str, List[str]]):
+        self.high_amount_threshold = high_amount_threshold
+        self.medians = dict(medians)
+        self.vocabularies = {col: list(values) for col, values in vocabularies.items()}
+    
+    def to_dict(self) -> Dict:
+        return {
+            "version": self.VERSION,
+            "high_amount_threshold": self.high_amount_threshold,
+            "medians": self.medians,
+            "vocabularies": self.vocabularies,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict) -> FeatureStatistics:
+        if data.get("version") != cls.VERSION:
+            raise ValueError(f"Unsupported feature statistics version: {data.get('version')}")
+        return cls(data["high_amount_threshold"], data["medians"], data["vocabularies"])
+    
+    def save(self, path: str):
+        """Write the statistics as JSON, e.g. next to the model pickle."""
+        with open(path, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+    
+    @classmethod
+    def load(cls, path: str) -> FeatureStatistics:
+        """Read statistics written by save()."""
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
 class TRYBEDiscrepancyDetector:
     """
     Detects floating cash transactions based on business rules.
@@ -171,6 +228,14 @@ class TRYBERiskPredictor:
     - AUC-ROC: ~0.95
     """
     
+    BASE_FEATURES = [
+        "amount", "simulated_network_latency", "transaction_type",
+        "recipient_type", "recipient_bank_name_or_ewallet",
+        "floating_duration_minutes", "is_fraudulent_attempt",
+        "is_cancellation", "manual_escalation_needed"
+    ]
+    CATEGORICAL_COLS = ["transaction_type", "recipient_type", "recipient_bank_name_or_ewallet"]
+    
     def __init__(self, model_type: str = "random_forest"):
         """
         Initialize predictor.
@@ -184,6 +249,23 @@ class TRYBERiskPredictor:
         self.model = None
         self.feature_cols: List[str] = []
         self.target_col: str = "is_floating_cash"
+        self.feature_stats: Optional[FeatureStatistics] = None
+        self._category_lookups: Dict[str, pd.Index] = {}
+        self._feature_plan: Optional[_FeaturePlan] = None
+    
+    def __getstate__(self) -> Dict:
+        # Lookup tables and the feature plan are rebuilt after loading
+        state = self.__dict__.copy()
+        state.pop("_category_lookups", None)
+        state.pop("_feature_plan", None)
+        return state
+    
+    def __setstate__(self, state: Dict):
+        # Models pickled before feature statistics existed have none
+        self.feature_stats = None
+        self.__dict__.update(state)
+        self._category_lookups = {}
+        self._feature_plan = self.compile_feature_plan() if self.model is not None else None
     
     def load_data(self, file_or_df: Union[str, pd.DataFrame]) -> pd.DataFrame:
         """
@@ -210,6 +292,10 @@ class TRYBERiskPredictor:
         """
         Preprocess data for model training/inference.
         
+        Training captures the feature statistics; inference uses them when
+        the model has them, and falls back to the batch's own statistics for
+        models saved without them.
+        
         Args:
             df: Raw DataFrame
             is_training: Whether this is for training (fits encoders) or inference
@@ -218,31 +304,40 @@ class TRYBERiskPredictor:
             Preprocessed DataFrame
         """
         df = DataSchemaAligner(df).frame.copy()
-        
-        # Base features
-        base_features = [
-            "amount", "simulated_network_latency", "transaction_type", 
-            "recipient_type", "recipient_bank_name_or_ewallet", 
-            "floating_duration_minutes", "is_fraudulent_attempt",
-            "is_cancellation", "manual_escalation_needed"
-        ]
-        
-        # Add engineered features
-        engineered = self._add_engineered_features(df)
-        self.feature_cols = [f for f in base_features + engineered if f in df.columns]
+        stats = None if is_training else self.feature_stats
+        
+        # Add engineered features; inference keeps the features the model was trained on
+        threshold = None
+        if stats is not None:
+            threshold = stats.high_amount_threshold
+        elif is_training and "amount" in df.columns:
+            threshold = float(df["amount"].quantile(0.9))
+        engineered = self._add_engineered_features(df, threshold)
+        if is_training:
+            self.feature_cols = [f for f in self.BASE_FEATURES + engineered if f in df.columns]
         
         # Handle missing values
+        medians: Dict[str, float] = {}
         for col in self.feature_cols:
             if col not in df.columns:
                 continue
-            if df[col].dtype == object or pd.api.types.is_categorical_dtype(df[col]):
+            if col in self.CATEGORICAL_COLS:
                 df[col] = df[col].fillna("unknown")
+                continue
+            if _is_categorical(df[col]):
+                # Numeric or flag column holding None, e.g. database rows
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+            if stats is not None:
+                if col in stats.medians:
+                    df[col] = df[col].fillna(stats.medians[col])
             else:
-                df[col] = df[col].fillna(df[col].median() if len(df) > 0 else 0)
+                median = df[col].median() if len(df) > 0 else 0
+                if is_training and pd.notna(median):
+                    medians[col] = float(median)
+                df[col] = df[col].fillna(median)
         
         # Encode categorical variables
-        categorical_cols = ["transaction_type", "recipient_type", "recipient_bank_name_or_ewallet"]
-        for col in categorical_cols:
+        for col in self.CATEGORICAL_COLS:
             if col not in df.columns or col not in self.feature_cols:
                 continue
                 
@@ -251,33 +346,82 @@ class TRYBERiskPredictor:
                 le = LabelEncoder()
                 df[col] = le.fit_transform(df[col].astype(str))
                 self.label_encoders[col] = le
+                self._category_lookups.pop(col, None)
             else:
-                # Use existing encoder
+                # Use existing encoder; unseen categories become -1
                 if col in self.label_encoders:
-                    le = self.label_encoders[col]
-                    # Handle unseen categories
-                    df[col] = df[col].astype(str).apply(
-                        lambda x: le.transform([x])[0] if x in le.classes_ else -1
-                    )
+                    df[col] = self._encode_categorical(col, df[col])
+        
+        if is_training:
+            self.feature_stats = FeatureStatistics(
+                threshold, medians,
+                {col: [str(c) for c in le.classes_] for col, le in self.label_encoders.items()}
+            )
         
         return df
     
-    def _add_engineered_features(self, df: pd.DataFrame) -> List[str]:
+    def _encode_categorical(self, col: str, values: pd.Series) -> np.ndarray:
+        """
+        Encode a whole column with the fitted encoder in one vectorized pass.
+        
+        Args:
+            col: Categorical column with a fitted encoder
+            values: Column values
+            
+        Returns:
+            Encoder codes, with -1 for categories unseen in training
+        """
+        # Hash lookup over the training vocabulary; position == LabelEncoder code
+        lookup = self._category_lookups.get(col)
+        if lookup is None:
+            lookup = pd.Index(self._vocabulary(col))
+            self._category_lookups[col] = lookup
+        return lookup.get_indexer(values.astype(str))
+    
+    def _vocabulary(self, col: str) -> List:
+        """Categories of a column in code order."""
+        if self.feature_stats is not None and col in self.feature_stats.vocabularies:
+            return self.feature_stats.vocabularies[col]
+        return list(self.label_encoders[col].classes_)
+    
+    def use_feature_statistics(self, stats: FeatureStatistics):
+        """
+        Attach feature statistics, e.g. loaded for a model pickled without them.
+        
+        Args:
+            stats: Statistics of the data the model was trained on
+        """
+        self.feature_stats = stats
+        self._category_lookups = {}
+        if self.model is not None:
+            self._feature_plan = self.compile_feature_plan()
+    
+    def _add_engineered_features(self, df: pd.DataFrame,
+                                 high_amount_threshold: Optional[float] = None) -> List[str]:
         """
         Create engineered features from raw data.
         
         Args:
             df: DataFrame to enhance
+            high_amount_threshold: Amount above which a transaction is high;
+                the batch's 90th percentile when None
             
         Returns:
             List of new column names added
         """
         new_cols: List[str] = []
         
+        # Numbers arriving as None or text (database rows) become NaN
+        for col in ("amount", "simulated_network_latency"):
+            if col in df.columns and _is_categorical(df[col]):
+                df[col] = pd.to_numeric(df[col], errors="coerce")
+        
         # Amount-based features
         if "amount" in df.columns:
             df["amount_log"] = np.log1p(df["amount"])
-            df["is_high_amount"] = (df["amount"] > df["amount"].quantile(0.9)).astype(int)
+            if high_amount_threshold is None:
+                high_amount_threshold = df["amount"].quantile(0.9)
+            df["is_high_amount"] = (df["amount"] > high_amount_threshold).astype(int)
             new_cols += ["amount_log", "is_high_amount"]
         
         # Network latency features
@@ -288,7 +432,9 @@ class TRYBERiskPredictor:
         # Time-based features
         if "timestamp_initiated" in df.columns:
             try:
-                ts = pd.to_datetime(df["timestamp_initiated"], errors="coerce")
+                # Each value parsed on its own: an inferred format would come from
+                # the first row and turn rows written differently into NaT
+                ts = pd.to_datetime(df["timestamp_initiated"], errors="coerce", format="ISO8601")
                 df["hour_of_day"] = ts.dt.hour
                 df["day_of_week"] = ts.dt.dayofweek
                 df["is_weekend"] = ts.dt.dayofweek.isin([5, 6]).astype(int)
@@ -298,8 +444,10 @@ class TRYBERiskPredictor:
         
         # Risk combination features
         if {"is_fraudulent_attempt", "manual_escalation_needed"}.issubset(df.columns):
+            # Missing flags count as False, as in _FeaturePlan._flag
             df["high_risk_combo"] = (
-                df["is_fraudulent_attempt"] | df["manual_escalation_needed"]
+                df["is_fraudulent_attempt"].fillna(False).astype(bool)
+                | df["manual_escalation_needed"].fillna(False).astype(bool)
             ).astype(int)
             new_cols.append("high_risk_combo")
         
@@ -360,6 +508,8 @@ class TRYBERiskPredictor:
         self.model = self._init_model()
         self.model.fit(X_train_scaled, y_train)
         
+        self._feature_plan = self.compile_feature_plan()
+        
         # Evaluate
         self._evaluate(X_test_scaled, y_test)
         
@@ -392,8 +542,13 @@ class TRYBERiskPredictor:
         if self.model is None:
             raise RuntimeError("Model not trained. Call train_model() first or load a trained model.")
         
-        # Convert to DataFrame if needed
-        tx_df = pd.DataFrame([transaction]) if isinstance(transaction, dict) else transaction.copy()
+        # Single transactions skip pandas entirely
+        if isinstance(transaction, dict):
+            if self._feature_plan is None:
+                self._feature_plan = self.compile_feature_plan()
+            return self._feature_plan.predict(transaction)
+        
+        tx_df = transaction.copy()
         
         # Preprocess
         tx_df = self.preprocess(tx_df, is_training=False)
@@ -411,6 +566,16 @@ class TRYBERiskPredictor:
         
         return proba[0] if len(proba) == 1 else proba
     
+    def compile_feature_plan(self) -> _FeaturePlan:
+        """
+        Compile the single-transaction feature pipeline for the trained model.
+        
+        Returns:
+            Plan that scores one transaction dict the same way as the
+            DataFrame path of predict_risk()
+        """
+        return _FeaturePlan(self)
+    
     def get_feature_importance(self) -> Optional[pd.DataFrame]:
         """
         Get feature importance for tree-based models.
@@ -427,4 +592,165 @@ class TRYBERiskPredictor:
                 'importance': self.model.feature_importances_
             }).sort_values('importance', ascending=False)
         
-        return None
\ No newline at end of file
+        return None
+
+class _FeaturePlan:
+    """
+    Single-transaction scoring compiled from a trained TRYBERiskPredictor.
+    
+    Maps a transaction dict straight to the scaled feature row with plain
+    Python, mirroring preprocess() and the scaler on a one-row DataFrame, so
+    predict_risk() on a dict skips pandas. Everything that does not depend on
+    the transaction (feature positions, category codes, the scaler's mean and
+    scale, a random forest's leaf probabilities) is worked out once here.
+    """
+    
+    def __init__(self, predictor: TRYBERiskPredictor):
+        self.model = predictor.model
+        self.feature_cols = list(predictor.feature_cols)
+        self.position = {col: i for i, col in enumerate(self.feature_cols)}
+        n = len(self.feature_cols)
+        
+        scaler = predictor.scaler
+        mean = getattr(scaler, "mean_", None)
+        scale = getattr(scaler, "scale_", None)
+        self.mean = [float(v) for v in (mean if mean is not None else np.zeros(n))]
+        self.scale = [float(v) for v in (scale if scale is not None else np.ones(n))]
+        
+        # Trees compare features as float32; linear models keep full precision
+        forest = isinstance(self.model, RandomForestClassifier)
+        dtype = np.float32 if forest else np.float64
+        # Features a transaction lacks are 0 before scaling, as in the DataFrame path
+        self.template = np.array(
+            [[(0.0 - m) / s for m, s in zip(self.mean, self.scale)]], dtype=dtype
+        )
+        
+        # Canonical column -> keys to look for, as DataSchemaAligner resolves them
+        self.sources = {
+            col: [col] + DataSchemaAligner._NAME_MAP.get(col, [])
+            for col in TRYBERiskPredictor.BASE_FEATURES + ["timestamp_initiated"]
+        }
+        self.codes = {
+            col: {str(c): code for code, c in enumerate(predictor._vocabulary(col))}
+            for col in predictor.label_encoders
+            if col in TRYBERiskPredictor.CATEGORICAL_COLS
+        }
+        stats = predictor.feature_stats
+        self.high_amount_threshold = stats.high_amount_threshold if stats is not None else None
+        self.medians = stats.medians if stats is not None else {}
+        
+        # Per tree: its structure and each node's probability of class 1.
+        # Older scikit-learn keeps class counts in tree_.value and normalizes
+        # them in predict_proba; newer releases store the fractions directly.
+        self.trees = None
+        if forest:
+            self.trees = []
+            for estimator in self.model.estimators_:
+                values = estimator.tree_.value[:, 0, :]
+                totals = values.sum(axis=1)
+                if not np.allclose(totals, 1.0):
+                    totals[totals == 0.0] = 1.0
+                    values = values / totals[:, np.newaxis]
+                self.trees.append((estimator.tree_, np.ascontiguousarray(values[:, 1])))
+    
+    def _lookup(self, transaction: Dict, col: str) -> tuple:
+        """(present, value) of a canonical column, honouring its aliases."""
+        for key in self.sources[col]:
+            if key in transaction:
+                return True, transaction[key]
+        return False, None
+    
+    @staticmethod
+    def _number(value: Any) -> float:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+    
+    @staticmethod
+    def _flag(value: Any) -> bool:
+        return value is not None and value == value and bool(value)
+    
+    @staticmethod
+    def _timestamp(value: Any) -> Optional[datetime]:
+        if isinstance(value, datetime):
+            return value
+        if isinstance(value, str):
+            # Before Python 3.11 fromisoformat only takes 3 or 6 fraction digits
+            iso = _FRACTION.sub(lambda m: "." + m.group(1)[:6].ljust(6, "0"), value, count=1)
+            try:
+                return datetime.fromisoformat(iso)
+            except ValueError:
+                pass
+        if value is None:
+            return None
+        stamp = pd.to_datetime(value, errors="coerce", format="ISO8601")
+        return None if pd.isna(stamp) else stamp
+    
+    def features(self, transaction: Dict) -> Dict[str, float]:
+        """Unscaled feature values present in a transaction, by feature name."""
+        values: Dict[str, float] = {}
+        present = {}
+        for col in self.sources:
+            found, value = self._lookup(transaction, col)
+            if found:
+                present[col] = value
+        
+        for col, value in present.items():
+            if col in self.codes:
+                category = "unknown" if value is None or value != value else str(value)
+                values[col] = float(self.codes[col].get(category, -1))
+            elif col != "timestamp_initiated":
+                values[col] = self._number(value)
+        
+        if "amount" in present:
+            amount = values["amount"]
+            values["amount_log"] = float(np.log1p(amount))
+            if self.high_amount_threshold is not None:
+                values["is_high_amount"] = float(amount > self.high_amount_threshold)
+            else:
+                # A lone transaction is never above its own batch's 90th percentile
+                values["is_high_amount"] = 0.0
+        if "simulated_network_latency" in present:
+            values["is_high_latency"] = float(values["simulated_network_latency"] > 1000)
+        if "timestamp_initiated" in present:
+            ts = self._timestamp(present["timestamp_initiated"])
+            if ts is None:
+                values.update(hour_of_day=np.nan, day_of_week=np.nan, is_weekend=0.0)
+            else:
+                day = ts.weekday()
+                values.update(hour_of_day=float(ts.hour), day_of_week=float(day),
+                              is_weekend=float(day >= 5))
+        if "is_fraudulent_attempt" in present and "manual_escalation_needed" in present:
+            values["high_risk_combo"] = float(
+                self._flag(present["is_fraudulent_attempt"])
+                or self._flag(present["manual_escalation_needed"])
+            )
+        
+        # Missing values take the training medians; without statistics a lone
+        # transaction's median is its own missing value
+        for col, median in self.medians.items():
+            if col in values and values[col] != values[col]:
+                values[col] = median
+        return values
+    
+    def row(self, transaction: Dict) -> np.ndarray:
+        """Scaled (1, n_features) row for one transaction."""
+        row = self.template.copy()
+        for col, value in self.features(transaction).items():
+            i = self.position.get(col)
+            if i is not None:
+                row[0, i] = (value - self.mean[i]) / self.scale[i]
+        return row
+    
+    def predict(self, transaction: Dict) -> float:
+        """Floating cash probability of one transaction."""
+        row = self.row(transaction)
+        if self.trees is None:
+            return self.model.predict_proba(row)[0, 1]
+        
+        # RandomForestClassifier.predict_proba without its thread pool
+        total = 0.0
+        for tree, probability in self.trees:
+            total += probability[tree.apply(row)[0]]
+        return total / len(self.trees)
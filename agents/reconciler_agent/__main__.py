@@ -1,8 +1,10 @@
 import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 
 import uvicorn
+from starlette.responses import JSONResponse
 from a2a.server.apps import A2AStarletteApplication
 from a2a.server.request_handlers import DefaultRequestHandler
 from a2a.server.tasks import InMemoryTaskStore
@@ -18,6 +20,9 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 from agent import ReconcilerAgent
 from agent_executor import ReconcilerAgentExecutor
 from dotenv import load_dotenv
+from spark_db.changes import ChangeFeed, change_feed_enabled
+from spark_db.metrics import registry as db_metrics_registry
+from spark_db.repository import get_repository
 from google.adk.artifacts import InMemoryArtifactService
 from google.adk.memory.in_memory_memory_service import InMemoryMemoryService
 from google.adk.runners import Runner
@@ -34,6 +39,26 @@ class MissingAPIKeyError(Exception):
     pass
 
 
+# Invalidates cached reads when another agent (the host's flags, retries) changes a transaction
+change_feed = ChangeFeed(get_repository())
+
+
+@asynccontextmanager
+async def lifespan(app):
+    """Open the database on the server's loop (pool and migrations for Postgres) and close it on shutdown."""
+    await get_repository().prepare()
+    if change_feed_enabled():
+        await change_feed.start()
+    yield
+    await change_feed.stop()
+    await get_repository().close()
+
+
+async def db_metrics(request):
+    """Per-query database metrics for this agent."""
+    return JSONResponse(db_metrics_registry.snapshot())
+
+
 def main():
     """Starts the Reconciler Agent server."""
     host = "localhost"
@@ -194,7 +219,9 @@ def main():
         )
 
         logger.info(f"Starting Reconciler Agent on {host}:{port}")
-        uvicorn.run(server.build(), host=host, port=port)
+        app = server.build(lifespan=lifespan)
+        app.add_route("/metrics/db", db_metrics, methods=["GET"])
+        uvicorn.run(app, host=host, port=port)
     except MissingAPIKeyError as e:
         logger.error(f"Error: {e}")
         exit(1)
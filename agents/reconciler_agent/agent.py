@@ -6,13 +6,13 @@ try:
     # Try relative imports first (when imported as a module)
     from .prompt import get_reconciler_prompt
     from .tools.transaction_fetcher import fetch_transaction_details
-    from .tools.retry_transaction import retry_transaction_tool
+    from .tools.retry_transaction import retry_transaction_tool, retry_transactions_tool
     from .sub_agents.escalator_agent.agent import escalator_agent
 except ImportError:
     # Fall back to absolute imports (when run directly)
     from prompt import get_reconciler_prompt
     from tools.transaction_fetcher import fetch_transaction_details
-    from tools.retry_transaction import retry_transaction_tool
+    from tools.retry_transaction import retry_transaction_tool, retry_transactions_tool
     from sub_agents.escalator_agent.agent import escalator_agent
 
 
@@ -32,6 +32,7 @@ class ReconcilerAgent:
             tools=[
                 fetch_transaction_details,
                 retry_transaction_tool,
+                retry_transactions_tool,
             ],
             sub_agents=[
                 escalator_agent,
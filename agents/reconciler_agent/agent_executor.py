@@ -19,10 +19,14 @@ from a2a.utils.errors import ServerError
 from google.adk import Runner
 from google.adk.events import Event
 from google.genai import types
+from spark_db.deadline import deadline, request_deadline_seconds
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Database budget for one A2A request, inside the host's 60 second client timeout
+EXECUTE_DEADLINE_SECONDS = request_deadline_seconds(55)
+
 
 class ReconcilerAgentExecutor(AgentExecutor):
     """An AgentExecutor that runs the Reconciler ADK-based Agent."""
@@ -85,13 +89,20 @@ class ReconcilerAgentExecutor(AgentExecutor):
         
         converted_parts = convert_a2a_parts_to_genai(context.message.parts)
         
-        await self._process_request(
-            types.UserContent(
-                parts=converted_parts,
-            ),
-            context.context_id,
-            updater,
-        )
+        # The host passes along whatever is left of its own request deadline
+        budget = EXECUTE_DEADLINE_SECONDS
+        metadata = context.message.metadata or {}
+        if metadata.get("deadline_seconds"):
+            budget = min(budget, float(metadata["deadline_seconds"]))
+        
+        with deadline(budget):
+            await self._process_request(
+                types.UserContent(
+                    parts=converted_parts,
+                ),
+                context.context_id,
+                updater,
+            )
 
     async def cancel(self, context: RequestContext, event_queue: EventQueue):
         raise ServerError(error=UnsupportedOperationError())
@@ -105,6 +105,7 @@ STRICT RULE: Only process MEDIUM and HIGH risk alerts
 <available_tools>
 - `fetch_transaction_details` - Gets transaction details
 - `retry_transaction_tool` - Retries a failed transaction (use cautiously for high-risk)
+- `retry_transactions_tool` - Retries many failed transactions in one call (e.g. after a bank outage); returns a result per transaction ID
 - `list_capabilities` - Lists your capabilities
 </available_tools>
 
@@ -123,7 +124,7 @@ STRICT RULE: Only process MEDIUM and HIGH risk alerts
 </critical_risk_handling_rules>
 
 <important_notes>
-- For transaction retry requests: ALWAYS call escalator_agent to create audit report
+- For transaction retry requests: ALWAYS call escalator_agent to create audit report, unless the retry result has duplicate_request=true (another request already retried and escalated it; just report its result)
 - For risk alerts: ONLY call escalator_agent if risk level is MEDIUM or HIGH (skip LOW risk)
 </important_notes>
 """
\ No newline at end of file
@@ -1,17 +1,16 @@
 """Tool for saving LLM-generated reports to the database."""
 
-import os
-import asyncio
-import asyncpg
 from datetime import datetime
 from typing import Dict, Any, Optional
 from google.adk.tools.tool_context import ToolContext
 from dotenv import load_dotenv
+from spark_db.deadline import TIMEOUT_ERRORS, timed_out_result
+from spark_db.repository import get_repository
 
 load_dotenv()
 
 
-def save_generated_report(
+async def save_generated_report(
     transaction_id: str,
     report_content: str,
     report_type: str = "ESCALATION",
@@ -46,109 +45,59 @@ def save_generated_report(
             "message": f"Invalid report type. Must be one of: {', '.join(valid_types)}"
         }
     
-    # Get database credentials from environment
-    db_config = {
-        'database': os.getenv('DB_NAME'),
-        'host': os.getenv('DB_HOST'),
-        'port': int(os.getenv('DB_PORT', 5432)),
-        'user': os.getenv('DB_USER'),
-        'password': os.getenv('DB_PASSWORD')
-    }
-    
-    # Run the async function synchronously
-    async def _async_save_report():
-        conn = None
-        try:
-            # Create connection
-            conn = await asyncpg.connect(**db_config)
-            
-            # Generate report ID
-            timestamp_str = datetime.now().strftime("%Y%m%d%H%M%S")
-            
-            # Determine report prefix based on type
-            if report_type == "RISK_ESCALATION":
-                report_prefix = "RISK_ESC"
-            elif report_type == "SUCCESS":
-                report_prefix = "SUC"
-            else:
-                report_prefix = "ESC"
-            
-            report_id = f"{report_prefix}_{timestamp_str}_{transaction_id}"
-            
-            # Get the next message_id (integer)
-            max_id_result = await conn.fetchrow("SELECT COALESCE(MAX(message_id), 0) as max_id FROM messages")
-            next_message_id = max_id_result['max_id'] + 1
-            
-            # Add metadata header to the report
-            metadata_header = f"""## Report Metadata
+    try:
+        # Generate report ID
+        timestamp_str = datetime.now().strftime("%Y%m%d%H%M%S")
+        
+        # Determine report prefix based on type
+        if report_type == "RISK_ESCALATION":
+            report_prefix = "RISK_ESC"
+        elif report_type == "SUCCESS":
+            report_prefix = "SUC"
+        else:
+            report_prefix = "ESC"
+        
+        report_id = f"{report_prefix}_{timestamp_str}_{transaction_id}"
+        
+        # Add metadata header to the report. The message ID is assigned by the
+        # database, so the header is split around it.
+        header_before_id = f"""## Report Metadata
 
 - **Report ID**: {report_id}
 - **Report Type**: {report_type}
 - **Priority**: {priority}
 - **Generated**: {datetime.now().isoformat()}
-- **Message ID**: {next_message_id}
+- **Message ID**: """
+        header_after_id = """
 
 ---
 
 """
-            
-            # Combine metadata with the LLM-generated report
-            full_report = metadata_header + report_content
-            
-            # Save the report to the messages table
-            insert_query = """
-                INSERT INTO messages (message_id, transaction_id, report)
-                VALUES ($1, $2, $3)
-            """
-            
-            await conn.execute(
-                insert_query,
-                next_message_id,
-                transaction_id,
-                full_report
-            )
-            
-            # Update the transaction to mark it as escalated if needed
-            if report_type in ["ESCALATION", "RISK_ESCALATION"]:
-                update_query = """
-                    UPDATE transactions
-                    SET manual_escalation_needed = TRUE
-                    WHERE transaction_id = $1
-                """
-                await conn.execute(update_query, transaction_id)
-            
-            await conn.close()
-            
-            return {
-                "status": "success",
-                "message": f"Report saved successfully",
-                "report_id": report_id,
-                "message_id": next_message_id,
-                "transaction_id": transaction_id,
-                "report_type": report_type,
-                "priority": priority,
-                "created_at": datetime.now().isoformat()
-            }
-            
-        except Exception as e:
-            if conn:
-                await conn.close()
-            return {
-                "status": "error",
-                "message": f"Failed to save report: {str(e)}"
-            }
-    
-    # Execute the async function
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # Create a new thread to run the async function
-            import concurrent.futures
-            with concurrent.futures.ThreadPoolExecutor() as executor:
-                future = executor.submit(asyncio.run, _async_save_report())
-                return future.result()
-        else:
-            return loop.run_until_complete(_async_save_report())
-    except RuntimeError:
-        # Fallback for when no event loop exists
-        return asyncio.run(_async_save_report())
\ No newline at end of file
+        
+        # The repository assigns the message ID, splices it into the header
+        # and flags the transaction for escalation in one atomic write
+        message_id = await get_repository().save_report(
+            transaction_id,
+            header_before_id,
+            header_after_id + report_content,
+            report_type in ["ESCALATION", "RISK_ESCALATION"]
+        )
+        
+        return {
+            "status": "success",
+            "message": f"Report saved successfully",
+            "report_id": report_id,
+            "message_id": message_id,
+            "transaction_id": transaction_id,
+            "report_type": report_type,
+            "priority": priority,
+            "created_at": datetime.now().isoformat()
+        }
+        
+    except TIMEOUT_ERRORS:
+        return timed_out_result("Saving the report", transaction_id=transaction_id, report_type=report_type)
+    except Exception as e:
+        return {
+            "status": "error",
+            "message": f"Failed to save report: {str(e)}"
+        }
@@ -1,9 +1,10 @@
 """Tools for the Reconciler Agent."""
 
 from .transaction_fetcher import fetch_transaction_details
-from .retry_transaction import retry_transaction_tool
+from .retry_transaction import retry_transaction_tool, retry_transactions_tool
 
 __all__ = [
     "fetch_transaction_details",
     "retry_transaction_tool",
+    "retry_transactions_tool",
 ]
\ No newline at end of file
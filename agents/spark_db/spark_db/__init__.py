@@ -0,0 +1,39 @@
+"""Shared PostgreSQL access layer for the SPARK agents."""
+
+from .encoding import install_codecs, records_to_dicts, records_to_json
+from .pool import (
+    PRIMARY,
+    REPLICA,
+    acquire,
+    close_pool,
+    db_config,
+    get_pool,
+    prewarm,
+    with_connection,
+)
+from .repository import (
+    TRANSACTION_COLUMNS,
+    PostgresTransactionRepository,
+    TransactionRepository,
+    create_repository,
+    get_repository,
+)
+
+__all__ = [
+    "PRIMARY",
+    "REPLICA",
+    "TRANSACTION_COLUMNS",
+    "PostgresTransactionRepository",
+    "TransactionRepository",
+    "acquire",
+    "close_pool",
+    "create_repository",
+    "db_config",
+    "get_pool",
+    "get_repository",
+    "install_codecs",
+    "prewarm",
+    "records_to_dicts",
+    "records_to_json",
+    "with_connection",
+]
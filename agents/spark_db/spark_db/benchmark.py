@@ -0,0 +1,103 @@
+"""
+Micro-benchmark: asyncpg codecs plus bulk JSON encoding versus the per-cell
+conversion the tools used to run on every row.
+
+Usage:
+    python -m spark_db.benchmark [--rows 10000] [--repeat 5]
+
+Needs the usual DB_* settings; rows are generated server-side, so no table
+has to exist.
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import asyncpg
+
+from .encoding import install_codecs, records_to_json
+from .pool import db_config
+
+# Synthetic rows shaped like ``transactions``: numeric, timestamps, text, booleans
+_BENCH_QUERY = """
+    SELECT 'TXN_' || g AS transaction_id,
+           'user_' || (g % 100) AS user_id,
+           (g * 1.37)::numeric(14, 2) AS amount,
+           'Bank to Bank (InstaPay)' AS transaction_type,
+           '2024-05-05'::timestamp + g * interval '1 minute' AS timestamp_initiated,
+           'completed' AS status_1,
+           '2024-05-05'::timestamp + g * interval '2 minute' AS status_timestamp_1,
+           '2024-05-05'::timestamp + g * interval '3 minute' AS status_timestamp_2,
+           '2024-05-05'::timestamp + g * interval '4 minute' AS expected_completion_time,
+           (g % 7)::double precision AS simulated_network_latency,
+           g % 5 = 0 AS is_floating_cash,
+           g % 30 AS floating_duration_minutes
+    FROM generate_series(1, $1) g
+"""
+
+
+def _convert_per_cell(value: Any) -> Any:
+    # The conversion the tools used to run on every cell
+    if isinstance(value, Decimal):
+        return float(value)
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        return value.decode("utf-8", errors="ignore")
+    if value is None:
+        return None
+    return value
+
+
+async def _benchmark(rows: int, repeat: int) -> None:
+    plain = await asyncpg.connect(**db_config())
+    coded = await asyncpg.connect(**db_config(), server_settings={"DateStyle": "ISO, MDY"})
+    await install_codecs(coded)
+    try:
+        def per_cell(records: List[asyncpg.Record]) -> str:
+            converted = []
+            for record in records:
+                row = {}
+                for key, value in dict(record).items():
+                    row[key] = _convert_per_cell(value)
+                converted.append(row)
+            return json.dumps(converted)
+
+        async def measure(conn: asyncpg.Connection, encode) -> Dict[str, float]:
+            best_fetch = best_encode = float("inf")
+            for _ in range(repeat):
+                start = time.perf_counter()
+                records = await conn.fetch(_BENCH_QUERY, rows)
+                fetched = time.perf_counter()
+                payload = encode(records)
+                done = time.perf_counter()
+                best_fetch = min(best_fetch, fetched - start)
+                best_encode = min(best_encode, done - fetched)
+            return {"fetch": best_fetch, "encode": best_encode, "bytes": len(payload)}
+
+        baseline = await measure(plain, per_cell)
+        codecs = await measure(coded, records_to_json)
+    finally:
+        await plain.close()
+        await coded.close()
+
+    print(f"{rows} rows, best of {repeat}")
+    for label, result in (("per-cell conversion", baseline), ("codecs + bulk encode", codecs)):
+        total = result["fetch"] + result["encode"]
+        print(f"  {label:22} fetch {result['fetch'] * 1000:7.1f} ms  "
+              f"encode {result['encode'] * 1000:7.1f} ms  total {total * 1000:7.1f} ms  "
+              f"({result['bytes']} bytes)")
+    speedup = (baseline["fetch"] + baseline["encode"]) / (codecs["fetch"] + codecs["encode"])
+    print(f"  speedup {speedup:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark row decoding and JSON encoding")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    asyncio.run(_benchmark(args.rows, args.repeat))
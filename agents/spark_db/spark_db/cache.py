@@ -0,0 +1,301 @@
+"""
+Read-through cache in front of a transaction repository.
+
+A single investigation turn typically lists the user's transactions, checks
+one for discrepancies and then asks for its status, which is three reads of
+the same rows. :class:`CachedTransactionRepository` serves the repeat reads
+from memory: rows listed in a page also seed the per-transaction entries,
+so the follow-up lookups do not touch the database at all.
+
+Entries expire after a TTL and the least recently used entry is evicted once
+the cache is full. Writes made through the repository invalidate what they
+touch. Writes made elsewhere, such as the reconciler retrying a transaction
+for the host, need an explicit :meth:`~CachedTransactionRepository.invalidate`.
+
+Environment:
+    DB_CACHE_TTL_SECONDS   Lifetime of a cached read; 0 disables the cache (default 30)
+    DB_CACHE_MAX_ENTRIES   Entries kept before LRU eviction (default 1024)
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, FrozenSet, Hashable, List, Optional, Sequence, Tuple
+
+from .repository import TransactionRepository
+
+_MISSING = object()
+
+
+def _copy(value: Any) -> Any:
+    # Callers get their own containers so they cannot mutate cached entries
+    if isinstance(value, dict):
+        return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy(item) for item in value]
+    return value
+
+
+class TTLCache:
+    """LRU cache with per-entry expiry and tag-based invalidation."""
+
+    def __init__(self, ttl: float, max_entries: int):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any, FrozenSet[Hashable]]]" = OrderedDict()
+        self._tagged: Dict[Hashable, set] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value, or ``_MISSING`` if absent or expired."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                self._discard(key)
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any, tags: Sequence[Hashable]) -> None:
+        """Cache ``value`` under ``key``; invalidating any of ``tags`` drops it."""
+        self._discard(key)
+        tag_set = frozenset(tags)
+        self._entries[key] = (time.monotonic() + self.ttl, value, tag_set)
+        for tag in tag_set:
+            self._tagged.setdefault(tag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, tag: Hashable) -> int:
+        """Drop every entry carrying ``tag``; returns how many were dropped."""
+        keys = self._tagged.pop(tag, set())
+        for key in keys:
+            self._discard(key)
+        self.invalidations += len(keys)
+        return len(keys)
+
+    def clear(self) -> None:
+        """Drop every entry."""
+        self._entries.clear()
+        self._tagged.clear()
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for tag in entry[2]:
+            keys = self._tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tagged[tag]
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+def _user_tag(user_id: Optional[str]) -> Tuple[str, Optional[str]]:
+    return ("user", user_id)
+
+
+def _txn_tag(transaction_id: str) -> Tuple[str, str]:
+    return ("txn", transaction_id)
+
+
+class CachedTransactionRepository(TransactionRepository):
+    """Wraps another repository with a per-process read-through cache."""
+
+    def __init__(self, inner: TransactionRepository, ttl: float = 30.0, max_entries: int = 1024):
+        self.inner = inner
+        self.cache = TTLCache(ttl, max_entries)
+
+    def _store_row(self, row: Dict[str, Any], user_id: Optional[str]) -> None:
+        transaction_id = row["transaction_id"]
+        self.cache.put(
+            ("txn", user_id, transaction_id), row,
+            [_txn_tag(transaction_id), _user_tag(row.get("user_id"))]
+        )
+
+    async def get_transaction(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        key = ("txn", user_id, transaction_id)
+        cached = self.cache.get(key)
+        if cached is not _MISSING:
+            return _copy(cached)
+
+        row = await self.inner.get_transaction(transaction_id, user_id)
+        if row is not None:
+            self._store_row(row, user_id)
+        return _copy(row)
+
+    async def get_transactions(
+        self,
+        transaction_ids: Sequence[str],
+        user_id: str
+    ) -> List[Dict[str, Any]]:
+        found: Dict[str, Dict[str, Any]] = {}
+        missing = []
+        for transaction_id in transaction_ids:
+            cached = self.cache.get(("txn", user_id, transaction_id))
+            if cached is _MISSING or cached is None:
+                missing.append(transaction_id)
+            else:
+                found[transaction_id] = cached
+
+        if missing:
+            for row in await self.inner.get_transactions(missing, user_id):
+                self._store_row(row, user_id)
+                found[row["transaction_id"]] = row
+        return [_copy(found[txn_id]) for txn_id in transaction_ids if txn_id in found]
+
+    async def get_transaction_context(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None,
+        report_limit: int = 5
+    ) -> Optional[Dict[str, Any]]:
+        key = ("context", user_id, transaction_id, report_limit)
+        cached = self.cache.get(key)
+        if cached is not _MISSING:
+            return _copy(cached)
+
+        context = await self.inner.get_transaction_context(transaction_id, user_id, report_limit)
+        if context is not None:
+            owner = context["transaction"].get("user_id")
+            self.cache.put(key, context, [_txn_tag(transaction_id), _user_tag(owner)])
+        return _copy(context)
+
+    async def list_user_transactions(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        key = ("page", user_id, limit, cursor)
+        cached = self.cache.get(key)
+        if cached is not _MISSING:
+            page, next_cursor = cached
+            return _copy(page), next_cursor
+
+        page, next_cursor = await self.inner.list_user_transactions(user_id, limit, cursor)
+        # A page goes stale when any of its rows changes or the user gets a new row
+        tags = [_user_tag(user_id)] + [_txn_tag(row["transaction_id"]) for row in page]
+        self.cache.put(key, (page, next_cursor), tags)
+        for row in page:
+            self._store_row(row, user_id)
+        return _copy(page), next_cursor
+
+    def stream_user_transactions(
+        self,
+        user_id: str,
+        prefetch: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        # Full-history scans are not worth holding in memory
+        return self.inner.stream_user_transactions(user_id, prefetch)
+
+    async def flag_floating_cash(
+        self,
+        transaction_id: str,
+        user_id: str,
+        floating_duration_minutes: int
+    ) -> bool:
+        try:
+            return await self.inner.flag_floating_cash(
+                transaction_id, user_id, floating_duration_minutes
+            )
+        finally:
+            self.invalidate(transaction_id=transaction_id)
+
+    async def flag_floating_cash_many(
+        self,
+        flags: Sequence[Tuple[str, str, int]]
+    ) -> int:
+        try:
+            return await self.inner.flag_floating_cash_many(flags)
+        finally:
+            for transaction_id, _user_id, _duration in flags:
+                self.invalidate(transaction_id=transaction_id)
+
+    async def create_retry(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        try:
+            result = await self.inner.create_retry(transaction_id, user_id)
+        except BaseException:
+            self.invalidate(transaction_id=transaction_id)
+            raise
+        # The new RTn_ row also changes its owner's history pages
+        self.invalidate(transaction_id=transaction_id, user_id=result.get("user_id"))
+        return result
+
+    async def create_retries(
+        self,
+        transaction_ids: Sequence[str],
+        user_id: Optional[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        try:
+            results = await self.inner.create_retries(transaction_ids, user_id)
+        except BaseException:
+            for transaction_id in transaction_ids:
+                self.invalidate(transaction_id=transaction_id)
+            raise
+        for transaction_id, result in results.items():
+            self.invalidate(transaction_id=transaction_id, user_id=result.get("user_id"))
+        return results
+
+    async def save_report(
+        self,
+        transaction_id: str,
+        report_prefix: str,
+        report_suffix: str,
+        escalate: bool
+    ) -> int:
+        try:
+            return await self.inner.save_report(
+                transaction_id, report_prefix, report_suffix, escalate
+            )
+        finally:
+            self.invalidate(transaction_id=transaction_id)
+
+    def invalidate(
+        self,
+        transaction_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> None:
+        self.inner.invalidate(transaction_id, user_id)
+        if transaction_id is None and user_id is None:
+            self.cache.clear()
+            return
+        if transaction_id is not None:
+            self.cache.invalidate(_txn_tag(transaction_id))
+        if user_id is not None:
+            self.cache.invalidate(_user_tag(user_id))
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        return self.cache.stats()
+
+    async def prepare(self) -> None:
+        await self.inner.prepare()
+
+    async def close(self) -> None:
+        self.cache.clear()
+        await self.inner.close()
@@ -0,0 +1,184 @@
+"""
+Change feed for the ``transactions`` table over Postgres LISTEN/NOTIFY.
+
+Migration 6 installs triggers that ``pg_notify`` a small JSON payload on
+:data:`CHANGE_CHANNEL` whenever a transaction is inserted or actually
+changes. :class:`ChangeFeed` holds one dedicated connection listening on that
+channel. For each change it invalidates the repository cache and hands the
+event to every subscriber for the affected user, so agents learn about
+settlements and retries as they are committed instead of by re-querying.
+
+Environment:
+    DB_CHANGE_FEED   Set to false to disable the listener (default true;
+                     always off for the sqlite backend)
+"""
+
+import asyncio
+import json
+import logging
+import os
+from typing import Any, Dict, Optional, Set
+
+import asyncpg
+
+from .pool import db_config
+from .repository import TransactionRepository
+
+logger = logging.getLogger(__name__)
+
+CHANGE_CHANNEL = "transaction_changes"
+
+# Sessions that set this to 'on' (the bulk loader) do not notify
+SUPPRESS_SETTING = "spark.bulk_load"
+
+NOTIFY_FUNCTION = f"""
+    CREATE OR REPLACE FUNCTION spark_notify_transaction_change() RETURNS trigger AS $$
+    BEGIN
+        IF current_setting('{SUPPRESS_SETTING}', true) = 'on' THEN
+            RETURN NULL;
+        END IF;
+        PERFORM pg_notify('{CHANGE_CHANNEL}', json_build_object(
+            'op', TG_OP,
+            'transaction_id', NEW.transaction_id,
+            'user_id', NEW.user_id,
+            'parent_transaction_id', NEW.parent_transaction_id,
+            'status', COALESCE(NEW.status_4, NEW.status_3, NEW.status_2, NEW.status_1),
+            'is_floating_cash', NEW.is_floating_cash,
+            'is_retry_successful', NEW.is_retry_successful,
+            'manual_escalation_needed', NEW.manual_escalation_needed
+        )::text);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+"""
+
+# Installed by migration 6. One trigger per event so that updates which
+# leave the row unchanged do not notify.
+CHANGE_FEED_DDL = [
+    NOTIFY_FUNCTION,
+    "DROP TRIGGER IF EXISTS transactions_notify_insert ON transactions",
+    """
+    CREATE TRIGGER transactions_notify_insert
+        AFTER INSERT ON transactions
+        FOR EACH ROW EXECUTE FUNCTION spark_notify_transaction_change()
+    """,
+    "DROP TRIGGER IF EXISTS transactions_notify_update ON transactions",
+    """
+    CREATE TRIGGER transactions_notify_update
+        AFTER UPDATE ON transactions
+        FOR EACH ROW WHEN (OLD.* IS DISTINCT FROM NEW.*)
+        EXECUTE FUNCTION spark_notify_transaction_change()
+    """,
+]
+
+# Events buffered per subscriber before the oldest are dropped
+_QUEUE_SIZE = 100
+
+# How often an idle listener checks that its connection is still alive
+_KEEPALIVE_SECONDS = 30.0
+
+
+def change_feed_enabled() -> bool:
+    """Whether the listener should run for the configured backend."""
+    if (os.getenv('DB_BACKEND') or 'postgres').lower() != 'postgres':
+        return False
+    return os.getenv('DB_CHANGE_FEED', 'true').lower() not in ('0', 'false', 'no')
+
+
+class ChangeFeed:
+    """Long-lived LISTEN connection that fans transaction changes out per user."""
+
+    def __init__(self, repository: TransactionRepository):
+        self.repository = repository
+        self._subscribers: Dict[str, Set["asyncio.Queue[Dict[str, Any]]"]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.events_received = 0
+
+    def subscribe(self, user_id: str) -> "asyncio.Queue[Dict[str, Any]]":
+        """Return a queue that receives every change to ``user_id``'s transactions."""
+        queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=_QUEUE_SIZE)
+        self._subscribers.setdefault(user_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, user_id: str, queue: "asyncio.Queue[Dict[str, Any]]") -> None:
+        """Stop delivering changes to ``queue``."""
+        queues = self._subscribers.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del self._subscribers[user_id]
+
+    def dispatch(self, event: Dict[str, Any]) -> None:
+        """Apply one change: invalidate cached reads, then notify subscribers."""
+        self.events_received += 1
+        user_id = event.get("user_id")
+        self.repository.invalidate(transaction_id=event.get("transaction_id"), user_id=user_id)
+        if event.get("parent_transaction_id"):
+            self.repository.invalidate(transaction_id=event["parent_transaction_id"])
+
+        for queue in self._subscribers.get(user_id, ()):
+            if queue.full():
+                # A slow consumer loses its oldest events rather than blocking the feed
+                queue.get_nowait()
+            queue.put_nowait(event)
+
+    def _on_notification(self, connection, pid, channel, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning("Ignoring malformed change notification: %r", payload)
+            return
+        self.dispatch(event)
+
+    async def start(self) -> None:
+        """Start listening in the background; reconnects until :meth:`stop`."""
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="spark-change-feed")
+
+    async def stop(self) -> None:
+        """Cancel the listener and close its connection."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self) -> None:
+        delay = 0.5
+        while True:
+            conn: Optional[asyncpg.Connection] = None
+            try:
+                conn = await asyncpg.connect(**db_config())
+                lost = asyncio.Event()
+                conn.add_termination_listener(lambda _conn: lost.set())
+                await conn.add_listener(CHANGE_CHANNEL, self._on_notification)
+                # Changes made while disconnected were missed
+                self.repository.invalidate()
+                logger.info("Listening for transaction changes on %s", CHANGE_CHANNEL)
+                delay = 0.5
+
+                while not lost.is_set():
+                    try:
+                        await asyncio.wait_for(lost.wait(), _KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        await conn.fetchval("SELECT 1", timeout=10)
+                logger.warning("Change feed connection closed; reconnecting")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning("Change feed unavailable (%s); retrying in %.1fs", e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+            finally:
+                if conn is not None and not conn.is_closed():
+                    await conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        """Listener state and event counters."""
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "events_received": self.events_received,
+            "subscribers": sum(len(queues) for queues in self._subscribers.values()),
+        }
@@ -0,0 +1,113 @@
+"""
+Per-request deadlines for database work.
+
+A request entry point (the host's ``/chat`` endpoints, the reconciler's A2A
+``execute``) opens :func:`deadline` once. The deadline lives in a context
+variable, so it reaches every tool the agent runs for that request without
+being threaded through their signatures. Each statement then gets the time
+left as its asyncpg ``timeout``, which cancels the statement on the server
+too, and no statement starts once the deadline has passed. Independently of
+any deadline, every pooled connection runs with ``statement_timeout`` set to
+``DB_STATEMENT_TIMEOUT_MS``.
+
+Tools catch :data:`TIMEOUT_ERRORS` and return :func:`timed_out_result`, so
+the LLM gets a structured answer instead of the request hanging until an
+HTTP timeout fires.
+
+Environment:
+    REQUEST_DEADLINE_SECONDS  Budget for one chat or A2A request (defaults per agent)
+    DB_STATEMENT_TIMEOUT_MS   Server-side cap on any single statement (default 30000)
+"""
+
+import asyncio
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+import asyncpg
+
+# Monotonic time by which the current request's database work must finish
+_deadline: ContextVar[Optional[float]] = ContextVar("spark_db_deadline", default=None)
+
+
+class DeadlineExceeded(asyncio.TimeoutError):
+    """The request's deadline passed before its database work could run."""
+
+
+# What a tool sees when a query runs out of time: the client-side asyncpg
+# timeout (or an exhausted deadline), or the server's statement_timeout
+TIMEOUT_ERRORS = (asyncio.TimeoutError, asyncpg.exceptions.QueryCanceledError)
+
+
+def request_deadline_seconds(default: float) -> float:
+    """The agent's request budget: ``REQUEST_DEADLINE_SECONDS`` or ``default``."""
+    return float(os.getenv('REQUEST_DEADLINE_SECONDS') or default)
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Bound the database work in this context to ``seconds`` from now.
+
+    A nested deadline can shorten the current one but never extend it.
+    ``None`` leaves the current deadline as it is.
+    """
+    if seconds is None:
+        yield
+        return
+
+    expires = time.monotonic() + seconds
+    current = _deadline.get()
+    if current is not None:
+        expires = min(expires, current)
+    token = _deadline.set(expires)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining() -> Optional[float]:
+    """
+    Seconds left before the current deadline, or None without one.
+
+    Raises:
+        DeadlineExceeded: If the deadline has already passed
+    """
+    expires = _deadline.get()
+    if expires is None:
+        return None
+    left = expires - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("Request deadline exceeded")
+    return left
+
+
+def statement_timeout(timeout: Optional[float] = None) -> Optional[float]:
+    """The tighter of an explicit asyncpg ``timeout`` and the time left on the deadline."""
+    left = remaining()
+    if timeout is None:
+        return left
+    return timeout if left is None else min(timeout, left)
+
+
+def timed_out_result(action: str, **extra: Any) -> Dict[str, Any]:
+    """
+    Tool result telling the LLM that ``action`` ran out of time.
+
+    Args:
+        action: What the tool was doing, e.g. "Fetching transaction details"
+        **extra: Additional fields for the result
+
+    Returns:
+        Dictionary with status "timed_out"
+    """
+    return {
+        "status": "timed_out",
+        "message": f"{action} timed out because the database is responding slowly. "
+                   "Tell the user it is taking longer than expected and offer to try again.",
+        "retryable": True,
+        **extra,
+    }
@@ -0,0 +1,110 @@
+"""
+Retry lineage for the ``transactions`` table.
+
+Retry rows (``RT1_<id>``, ``RT2_<id>``) record the transaction they retry in
+``parent_transaction_id`` and their attempt in ``retry_number``. Counting or
+listing the retries of a transaction is then an index lookup instead of a
+``LIKE 'RT%_' || id`` scan over the whole table.
+
+Usage:
+    python -m spark_db.lineage [--batch-size N] [--start-after TRANSACTION_ID]
+
+Adds the columns and index if missing (migration 2 in ``spark_db.migrations``
+does the same), then backfills lineage for existing ``RTn_`` rows. The backfill commits per batch and only touches rows whose
+lineage is still empty, so it can be interrupted and rerun at any point;
+``--start-after`` skips keys that a previous run already walked past.
+"""
+
+import argparse
+import asyncio
+import logging
+
+import asyncpg
+
+from .pool import close_pool, with_connection
+
+logger = logging.getLogger(__name__)
+
+LINEAGE_DDL = [
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS parent_transaction_id TEXT",
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS retry_number INTEGER",
+    """
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_retry_lineage
+        ON transactions (parent_transaction_id, retry_number)
+        WHERE parent_transaction_id IS NOT NULL
+    """,
+]
+
+_BACKFILL_BATCH = """
+    WITH batch AS (
+        SELECT transaction_id
+        FROM transactions
+        WHERE transaction_id > $1
+        ORDER BY transaction_id
+        LIMIT $2
+    ), updated AS (
+        UPDATE transactions t
+        SET parent_transaction_id = substring(t.transaction_id from '^RT[0-9]+_(.+)$'),
+            retry_number = substring(t.transaction_id from '^RT([0-9]+)_')::int
+        FROM batch
+        WHERE t.transaction_id = batch.transaction_id
+          AND t.parent_transaction_id IS NULL
+          AND t.transaction_id ~ '^RT[0-9]+_.+$'
+        RETURNING 1
+    )
+    SELECT (SELECT max(transaction_id) FROM batch) AS last_id,
+           (SELECT count(*) FROM updated) AS updated
+"""
+
+
+async def ensure_lineage_schema(conn: asyncpg.Connection) -> None:
+    """Add the lineage columns and index if they do not exist yet."""
+    for statement in LINEAGE_DDL:
+        await conn.execute(statement)
+
+
+async def backfill_retry_lineage(batch_size: int = 1000, start_after: str = "") -> int:
+    """
+    Fill ``parent_transaction_id``/``retry_number`` for existing retry rows.
+
+    Walks the primary key in batches, each committed on its own, so progress
+    survives an interruption.
+
+    Args:
+        batch_size: Primary keys examined per batch
+        start_after: Resume after this transaction ID
+
+    Returns:
+        Number of rows updated
+    """
+    total = 0
+    last_id = start_after
+    while True:
+        row = await with_connection(
+            lambda conn: conn.fetchrow(_BACKFILL_BATCH, last_id, batch_size)
+        )
+        if row is None or row['last_id'] is None:
+            break
+        last_id = row['last_id']
+        total += row['updated']
+        logger.info("Backfilled %d retry rows (through %s)", total, last_id)
+    return total
+
+
+async def _main(batch_size: int, start_after: str) -> None:
+    try:
+        await with_connection(ensure_lineage_schema)
+        total = await backfill_retry_lineage(batch_size, start_after)
+        print(f"Retry lineage backfill complete: {total} rows updated")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add and backfill retry lineage on transactions")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--start-after", default="", help="Resume after this transaction ID")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_main(args.batch_size, args.start_after))
@@ -0,0 +1,345 @@
+"""
+Bulk loader for the ``transactions`` and ``users`` tables.
+
+Streams a CSV or Parquet file into Postgres with binary ``COPY``
+(``copy_records_to_table``) in batches. Seeding millions of generated
+transactions then takes minutes instead of the hours row-by-row ``INSERT``
+statements would.
+
+Usage:
+    python -m spark_db.loader transactions synthetic_transactions.csv
+    python -m spark_db.loader users models/datasets/user_wallet_balances.csv
+        [--batch-size N] [--skip-existing] [--restart]
+
+Column names are mapped the same way ``DataSchemaAligner`` in
+``trybe_models.py`` maps them (``txn_id`` -> ``transaction_id``,
+``final_status`` -> ``status_4``, ...). Columns the table does not have are
+reported and skipped. Values are converted per column to the table's types.
+
+Each batch is copied and recorded in ``spark_load_progress`` (migration 7)
+in the same transaction. An interrupted load therefore resumes after the
+last committed batch when it is run again, and never loads a row twice;
+``--restart`` discards the recorded progress. ``--skip-existing`` copies
+through a staging table and ignores rows whose key already exists. Rows
+loaded into ``transactions`` do not go out on the change feed.
+
+The row triggers of ``spark_db.status_events`` (migration 8) still fire for
+every copied ``transactions`` row: each row gets its ``current_status`` and
+one ``transaction_status_events`` insert per filled ``status_n`` pair. With
+all four pairs filled that roughly triples the copy time. The triggers are
+left on deliberately: copying with them off and running the
+``spark_db.status_events`` backfill afterwards takes longer in total.
+
+Requires pandas, plus pyarrow for Parquet (``pip install spark-db[loader]``).
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from .changes import SUPPRESS_SETTING
+from .pool import db_config
+
+logger = logging.getLogger(__name__)
+
+# Installed by migration 7
+LOAD_PROGRESS_DDL = [
+    """
+    CREATE TABLE IF NOT EXISTS spark_load_progress (
+        source TEXT NOT NULL,
+        target_table TEXT NOT NULL,
+        rows_loaded BIGINT NOT NULL DEFAULT 0,
+        updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+        PRIMARY KEY (source, target_table)
+    )
+    """,
+]
+
+# Tables the loader may write, with their conflict key
+TABLE_KEYS = {
+    "transactions": "transaction_id",
+    "users": "user_id",
+}
+
+# canonical column -> aliases used by raw datasets (DataSchemaAligner._NAME_MAP)
+COLUMN_ALIASES: Dict[str, List[str]] = {
+    "transaction_id": ["txn_id", "id"],
+    "user_id": ["uid"],
+    "amount": ["txn_amount"],
+    "transaction_type": ["transaction_types", "txn_type"],
+    "status_4": ["final_status", "status_final"],
+    "is_floating_cash": ["ground_truth_floating"],
+    "floating_duration_minutes": ["float_minutes"],
+    "manual_escalation_needed": ["escalate"],
+    "is_fraudulent_attempt": ["fraud_flag"],
+    "simulated_network_latency": ["network_latency", "latency_ms"],
+    "recipient_bank_name_or_ewallet": ["recipient_bank", "recipient_bank/e-wallet_name",
+                                       "recipient_bank_name/e-wallet_name"],
+    "timestamp_initiated": ["timestamp", "initiated_at"],
+    "is_cancellation": ["cancel_flag"],
+}
+
+_TRUE = {"true", "t", "1", "1.0", "yes", "y"}
+_FALSE = {"false", "f", "0", "0.0", "no", "n"}
+
+
+def align_columns(columns: Sequence[str]) -> Dict[str, str]:
+    """
+    Map source column names to canonical ones.
+
+    Like ``DataSchemaAligner``, an alias is only used when the canonical
+    column is absent, and the first alias present wins.
+
+    Returns:
+        Source name -> canonical name for every renamed column
+    """
+    present = set(columns)
+    renames: Dict[str, str] = {}
+    for canonical, aliases in COLUMN_ALIASES.items():
+        if canonical in present:
+            continue
+        for alias in aliases:
+            if alias in present:
+                renames[alias] = canonical
+                break
+    return renames
+
+
+def _read_batches(path: str, batch_size: int, skip_rows: int) -> Iterator[Any]:
+    """Yield DataFrames of up to ``batch_size`` rows, starting after ``skip_rows``."""
+    try:
+        import pandas as pd
+    except ImportError:
+        raise SystemExit("The loader needs pandas: pip install 'spark-db[loader]'")
+
+    if path.lower().endswith((".parquet", ".pq")):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise SystemExit("Loading Parquet needs pyarrow: pip install 'spark-db[loader]'")
+
+        to_skip = skip_rows
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            if to_skip >= record_batch.num_rows:
+                to_skip -= record_batch.num_rows
+                continue
+            yield record_batch.slice(to_skip).to_pandas()
+            to_skip = 0
+    else:
+        # Everything as text; values are converted per target column type
+        yield from pd.read_csv(
+            path, chunksize=batch_size, dtype=str, keep_default_na=True,
+            skiprows=range(1, skip_rows + 1) if skip_rows else None,
+        )
+
+
+def _convert(series: Any, data_type: str) -> List[Any]:
+    """Convert one column to Python values asyncpg's binary COPY accepts."""
+    import pandas as pd
+
+    if data_type == "boolean":
+        text = series.astype(str).str.strip().str.lower()
+        values = text.map(lambda v: True if v in _TRUE else False if v in _FALSE else None)
+        return values.where(series.notna(), None).tolist()
+    if data_type in ("integer", "bigint", "smallint"):
+        numbers = pd.to_numeric(series, errors="coerce").round().astype("Int64")
+        return [None if pd.isna(v) else int(v) for v in numbers]
+    if data_type in ("numeric", "double precision", "real"):
+        numbers = pd.to_numeric(series, errors="coerce")
+        return [None if pd.isna(v) else float(v) for v in numbers]
+    if data_type.startswith("timestamp"):
+        stamps = pd.to_datetime(series, errors="coerce")
+        return [None if pd.isna(v) else v.to_pydatetime() for v in stamps]
+    return [None if pd.isna(v) else str(v) for v in series]
+
+
+class BulkLoader:
+    """Copies batches from one file into one table on a dedicated connection."""
+
+    def __init__(self, conn: asyncpg.Connection, table: str, source: str,
+                 skip_existing: bool = False):
+        if table not in TABLE_KEYS:
+            raise ValueError(f"Cannot load {table!r}; expected one of {sorted(TABLE_KEYS)}")
+        self.conn = conn
+        self.table = table
+        self.source = source
+        self.skip_existing = skip_existing
+        self.column_types: Dict[str, str] = {}
+
+    async def prepare(self, restart: bool) -> int:
+        """
+        Read the table's columns and the progress of earlier runs.
+
+        Returns:
+            Rows of the source already loaded
+        """
+        rows = await self.conn.fetch(
+            """
+            SELECT column_name, data_type FROM information_schema.columns
+            WHERE table_schema = current_schema() AND table_name = $1
+            """,
+            self.table
+        )
+        if not rows:
+            raise RuntimeError(f"Table {self.table} does not exist; run spark_db.migrations first")
+        self.column_types = {row["column_name"]: row["data_type"] for row in rows}
+
+        for statement in LOAD_PROGRESS_DDL:
+            await self.conn.execute(statement)
+        if restart:
+            await self.conn.execute(
+                "DELETE FROM spark_load_progress WHERE source = $1 AND target_table = $2",
+                self.source, self.table
+            )
+            return 0
+        loaded = await self.conn.fetchval(
+            "SELECT rows_loaded FROM spark_load_progress WHERE source = $1 AND target_table = $2",
+            self.source, self.table
+        )
+        return loaded or 0
+
+    def records(self, frame: Any) -> Tuple[List[str], List[Tuple[Any, ...]]]:
+        """Align, filter and convert a DataFrame into COPY columns and records."""
+        frame = frame.rename(columns=align_columns(list(frame.columns)))
+        columns = [column for column in frame.columns if column in self.column_types]
+        converted = [_convert(frame[column], self.column_types[column]) for column in columns]
+        return columns, list(zip(*converted))
+
+    async def load_batch(self, columns: List[str], records: List[Tuple[Any, ...]],
+                         rows_read: int) -> int:
+        """
+        Copy one batch and record the progress atomically.
+
+        Returns:
+            Rows inserted (fewer than ``len(records)`` with ``skip_existing``)
+        """
+        async with self.conn.transaction():
+            await self.conn.execute(f"SET LOCAL {SUPPRESS_SETTING} = 'on'")
+            if not records:
+                await self._record_progress(rows_read)
+                return 0
+            if self.skip_existing:
+                await self.conn.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS spark_load_staging "
+                    f"(LIKE {self.table} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"
+                )
+                await self.conn.copy_records_to_table(
+                    "spark_load_staging", records=records, columns=columns
+                )
+                column_list = ", ".join(columns)
+                status = await self.conn.execute(
+                    f"INSERT INTO {self.table} ({column_list}) "
+                    f"SELECT {column_list} FROM spark_load_staging "
+                    f"ON CONFLICT ({TABLE_KEYS[self.table]}) DO NOTHING"
+                )
+                inserted = int(status.split()[-1])
+            else:
+                await self.conn.copy_records_to_table(
+                    self.table, records=records, columns=columns
+                )
+                inserted = len(records)
+
+            await self._record_progress(rows_read)
+        return inserted
+
+    async def _record_progress(self, rows_read: int) -> None:
+        await self.conn.execute(
+            """
+            INSERT INTO spark_load_progress (source, target_table, rows_loaded)
+            VALUES ($1, $2, $3)
+            ON CONFLICT (source, target_table)
+            DO UPDATE SET rows_loaded = EXCLUDED.rows_loaded, updated_at = now()
+            """,
+            self.source, self.table, rows_read
+        )
+
+
+async def load_file(
+    path: str,
+    table: str,
+    batch_size: int = 10000,
+    skip_existing: bool = False,
+    restart: bool = False,
+    source: Optional[str] = None
+) -> Dict[str, int]:
+    """
+    Load ``path`` into ``table``, resuming after any rows loaded before.
+
+    Args:
+        path: CSV or Parquet file
+        table: "transactions" or "users"
+        batch_size: Rows per COPY and per progress checkpoint
+        skip_existing: Ignore rows whose key is already in the table
+        restart: Forget earlier progress and load from the first row
+        source: Progress key (default: the file's absolute path)
+
+    Returns:
+        Rows skipped as already loaded, read and inserted by this run
+    """
+    source = source or os.path.abspath(path)
+    conn = await asyncpg.connect(**db_config())
+    try:
+        loader = BulkLoader(conn, table, source, skip_existing)
+        skipped = await loader.prepare(restart)
+        if skipped:
+            logger.info("Resuming %s after %d rows already loaded", path, skipped)
+
+        rows_read = skipped
+        inserted = 0
+        warned = False
+        start = time.monotonic()
+        for frame in _read_batches(path, batch_size, skipped):
+            columns, records = loader.records(frame)
+            if not warned:
+                ignored = sorted(set(frame.columns) - set(align_columns(list(frame.columns)))
+                                 - set(columns))
+                if ignored:
+                    logger.warning("Ignoring columns not in %s: %s", table, ", ".join(ignored))
+                if not columns:
+                    logger.warning("No columns of %s map to %s; nothing will be copied",
+                                   path, table)
+                warned = True
+
+            # Rows read from the file, so a batch with nothing to copy still advances
+            rows_read += len(frame)
+            inserted += await loader.load_batch(columns, records, rows_read)
+            elapsed = time.monotonic() - start
+            logger.info("Loaded %d rows into %s (%d this run, %.0f rows/s)",
+                        rows_read, table, rows_read - skipped,
+                        (rows_read - skipped) / elapsed if elapsed else 0)
+        return {"skipped": skipped, "read": rows_read - skipped, "inserted": inserted}
+    finally:
+        await conn.close()
+
+
+async def _main(args: argparse.Namespace) -> None:
+    result = await load_file(
+        args.path, args.table, args.batch_size, args.skip_existing, args.restart
+    )
+    print(f"Loaded {args.path} into {args.table}: {result['inserted']} rows inserted, "
+          f"{result['read']} read, {result['skipped']} already loaded before")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Bulk load a CSV or Parquet file with COPY")
+    parser.add_argument("table", choices=sorted(TABLE_KEYS))
+    parser.add_argument("path", help="CSV or Parquet file")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--skip-existing", action="store_true",
+                        help="Ignore rows whose primary key is already in the table")
+    parser.add_argument("--restart", action="store_true",
+                        help="Discard recorded progress and load from the first row")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    try:
+        asyncio.run(_main(args))
+    except (RuntimeError, ValueError, FileNotFoundError) as e:
+        print(f"Load failed: {e}", file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,287 @@
+"""
+In-process metrics for database queries.
+
+Every repository statement runs under a stable name that matches the plan
+check in ``spark_db.migrations`` where one exists, e.g.
+``host.query_user_transactions`` or ``reconciler.retry``. For each
+name :data:`registry` keeps:
+
+* a latency histogram (milliseconds)
+* calls, errors, rows returned or affected, and approximate bytes decoded
+* a histogram of time spent waiting for a pooled connection
+* the last few slow calls (``DB_SLOW_QUERY_MS``), with the shape of their
+  parameters (types and array lengths, never values) and a sampled
+  ``EXPLAIN`` plan, taken in the background on a separate pooled connection
+  so the slow request does not wait for it
+
+``with_connection(..., name=...)`` hands operations a
+:class:`TracedConnection`, which records each ``fetch``/``fetchrow``/
+``fetchval``/``execute`` under the operation's name unless the call passes
+its own ``name=``. The host API server serves :meth:`MetricsRegistry.snapshot`
+at ``/metrics/db``.
+
+Environment:
+    DB_SLOW_QUERY_MS   Queries at least this slow are sampled (default 250)
+"""
+
+import asyncio
+import bisect
+import contextvars
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Sequence, Set
+
+from .deadline import statement_timeout
+
+logger = logging.getLogger(__name__)
+
+# Histogram bucket upper bounds in milliseconds; the last bucket is unbounded
+BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+# Slow samples kept per query name
+_SLOW_SAMPLES = 5
+
+# At most one EXPLAIN per query name in this many seconds
+_EXPLAIN_INTERVAL = 60.0
+
+# Budget for getting a connection for an EXPLAIN sample, and for running it
+_EXPLAIN_TIMEOUT = 2.0
+
+# Running EXPLAIN samples, referenced until they finish
+_explain_tasks: Set[asyncio.Task] = set()
+
+
+async def _explain(sample: Dict[str, Any], query: str, args: Sequence[Any]) -> None:
+    """Attach the plan of ``query`` to a slow-query sample."""
+    # Imported here: pool imports this module
+    from .pool import get_pool
+
+    try:
+        pool = await get_pool()
+        async with pool.acquire(timeout=_EXPLAIN_TIMEOUT) as conn:
+            # Plain EXPLAIN plans the statement without running it again
+            plan = await conn.fetch(f"EXPLAIN {query}", *args, timeout=_EXPLAIN_TIMEOUT)
+        sample["plan"] = [row[0] for row in plan]
+    except Exception as e:
+        sample["plan_error"] = str(e) or type(e).__name__
+
+
+class Histogram:
+    """Fixed-bucket histogram of millisecond durations."""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value_ms: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, value_ms)] += 1
+        self.count += 1
+        self.total += value_ms
+        if value_ms > self.max:
+            self.max = value_ms
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the ``q`` quantile."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS_MS, self.counts):
+            seen += count
+            if seen >= rank:
+                return float(min(bound, self.max))
+        return self.max
+
+    def snapshot(self) -> Dict[str, Any]:
+        buckets = {f"le_{bound}": count for bound, count in zip(BUCKETS_MS, self.counts)}
+        buckets["le_inf"] = self.counts[-1]
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count if self.count else 0.0,
+            "p50_ms": self.quantile(0.5),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": self.max,
+            "buckets": buckets,
+        }
+
+
+class QueryStats:
+    """Counters for one query name."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.pool_wait = Histogram()
+        self.errors = 0
+        self.rows = 0
+        self.bytes_decoded = 0
+        self.slow: Deque[Dict[str, Any]] = deque(maxlen=_SLOW_SAMPLES)
+        self.last_explain = float("-inf")
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "calls": self.latency.count,
+            "errors": self.errors,
+            "rows": self.rows,
+            "bytes_decoded": self.bytes_decoded,
+            "latency": self.latency.snapshot(),
+            "pool_wait": self.pool_wait.snapshot(),
+            "slow_samples": list(self.slow),
+        }
+
+
+class MetricsRegistry:
+    """Per-name query statistics for this process."""
+
+    def __init__(self, slow_query_ms: float = 250.0):
+        self.slow_query_ms = slow_query_ms
+        self._stats: Dict[str, QueryStats] = {}
+
+    def stats(self, name: str) -> QueryStats:
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = QueryStats()
+        return stats
+
+    def observe_pool_wait(self, name: str, wait_ms: float) -> None:
+        self.stats(name).pool_wait.observe(wait_ms)
+
+    def observe_error(self, name: str) -> None:
+        self.stats(name).errors += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """JSON-ready statistics for every query name seen so far."""
+        return {
+            "slow_query_ms": self.slow_query_ms,
+            "queries": {name: stats.snapshot() for name, stats in sorted(self._stats.items())},
+        }
+
+    def reset(self) -> None:
+        self._stats.clear()
+
+
+registry = MetricsRegistry(float(os.getenv('DB_SLOW_QUERY_MS') or 250))
+
+
+def parameter_shape(args: Sequence[Any]) -> List[str]:
+    """Describe query parameters by type (and length for arrays) without their values."""
+    shape = []
+    for arg in args:
+        if isinstance(arg, (list, tuple)):
+            element = type(arg[0]).__name__ if arg else "empty"
+            shape.append(f"{element}[{len(arg)}]")
+        else:
+            shape.append(type(arg).__name__)
+    return shape
+
+
+def _rows(result: Any) -> int:
+    if result is None:
+        return 0
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, str):
+        # Command tag, e.g. "UPDATE 3" or "INSERT 0 1"
+        count = result.rsplit(" ", 1)[-1]
+        return int(count) if count.isdigit() else 0
+    return 1
+
+
+def _decoded_bytes(result: Any) -> int:
+    # Approximate: text/bytea lengths plus 8 bytes for any other non-null value
+    if isinstance(result, list):
+        records = result
+    elif hasattr(result, "values"):
+        records = [result]
+    else:
+        return len(result) if isinstance(result, (str, bytes)) else 8 if result is not None else 0
+
+    total = 0
+    for record in records:
+        for value in record.values():
+            if isinstance(value, (str, bytes)):
+                total += len(value)
+            elif value is not None:
+                total += 8
+    return total
+
+
+class TracedConnection:
+    """
+    Connection wrapper that records each statement in :data:`registry`.
+
+    Statements are also bounded by the request deadline (``spark_db.deadline``).
+
+    Anything other than the four query methods (``transaction()``,
+    ``cursor()``, ...) is passed through to the wrapped connection.
+    """
+
+    def __init__(self, conn, name: str, metrics: MetricsRegistry = registry):
+        self._conn = conn
+        self._name = name
+        self._metrics = metrics
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._conn, attr)
+
+    async def _run(self, method: str, query: str, args: Sequence[Any],
+                   timeout: Optional[float], name: Optional[str]) -> Any:
+        name = name or self._name
+        stats = self._metrics.stats(name)
+        start = time.perf_counter()
+        try:
+            result = await getattr(self._conn, method)(
+                query, *args, timeout=statement_timeout(timeout)
+            )
+        except BaseException:
+            stats.errors += 1
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        stats.latency.observe(elapsed_ms)
+        stats.rows += _rows(result)
+        if method != "execute":
+            stats.bytes_decoded += _decoded_bytes(result)
+        if elapsed_ms >= self._metrics.slow_query_ms:
+            self._sample_slow(stats, name, query, args, elapsed_ms)
+        return result
+
+    def _sample_slow(self, stats: QueryStats, name: str, query: str,
+                     args: Sequence[Any], elapsed_ms: float) -> None:
+        sample: Dict[str, Any] = {
+            "at": time.time(),
+            "duration_ms": round(elapsed_ms, 3),
+            "parameters": parameter_shape(args),
+        }
+        now = time.monotonic()
+        if now - stats.last_explain >= _EXPLAIN_INTERVAL:
+            stats.last_explain = now
+            # Outside the request's context, so its deadline does not apply
+            task = contextvars.Context().run(
+                asyncio.create_task, _explain(sample, query, args), name=f"spark-explain-{name}"
+            )
+            _explain_tasks.add(task)
+            task.add_done_callback(_explain_tasks.discard)
+        stats.slow.append(sample)
+        logger.warning("Slow query %s: %.1f ms (parameters %s)",
+                       name, elapsed_ms, sample["parameters"])
+
+    async def fetch(self, query: str, *args, timeout: Optional[float] = None,
+                    name: Optional[str] = None) -> List[Any]:
+        return await self._run("fetch", query, args, timeout, name)
+
+    async def fetchrow(self, query: str, *args, timeout: Optional[float] = None,
+                       name: Optional[str] = None) -> Any:
+        return await self._run("fetchrow", query, args, timeout, name)
+
+    async def fetchval(self, query: str, *args, timeout: Optional[float] = None,
+                       name: Optional[str] = None) -> Any:
+        return await self._run("fetchval", query, args, timeout, name)
+
+    async def execute(self, query: str, *args, timeout: Optional[float] = None,
+                      name: Optional[str] = None) -> str:
+        return await self._run("execute", query, args, timeout, name)
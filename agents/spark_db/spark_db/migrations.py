@@ -0,0 +1,326 @@
+"""
+Versioned schema migrations for the tables the SPARK agents use.
+
+Each migration runs in its own transaction and is recorded in
+``spark_schema_version``, so applying them is idempotent. A session-level
+advisory lock keeps the host and reconciler from migrating at the same time
+when they start together.
+
+Usage:
+    python -m spark_db.migrations            # apply pending migrations
+    python -m spark_db.migrations --check    # also fail if any tool query seq-scans
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import Any, Dict, List, Sequence, Tuple
+
+import asyncpg
+
+from .changes import CHANGE_FEED_DDL, NOTIFY_FUNCTION
+from .lineage import LINEAGE_DDL
+from .loader import LOAD_PROGRESS_DDL
+from .status_events import STATUS_EVENTS_DDL
+from .pool import acquire, close_pool
+from .repository import (
+    FLAG_FLOATING_CASH,
+    FLAG_FLOATING_CASH_MANY,
+    RETRY_TRANSACTIONS,
+    SAVE_REPORT,
+    SELECT_TRANSACTION_BY_ID,
+    SELECT_USER_TRANSACTION,
+    SELECT_USER_TRANSACTIONS,
+    TRANSACTION_CONTEXT,
+    USER_HISTORY_FIRST_PAGE,
+    USER_HISTORY_PAGE,
+)
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key shared by every process that migrates this database
+_MIGRATION_LOCK_KEY = 0x5350524B
+
+# (version, description, statements)
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "create transactions, messages and users tables", [
+        """
+        CREATE TABLE IF NOT EXISTS transactions (
+            transaction_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            amount NUMERIC(14, 2),
+            transaction_type TEXT,
+            recipient_type TEXT,
+            recipient_account_id TEXT,
+            recipient_bank_name_or_ewallet TEXT,
+            device_id TEXT,
+            location_coordinates TEXT,
+            timestamp_initiated TIMESTAMP,
+            status_1 TEXT,
+            status_timestamp_1 TIMESTAMP,
+            status_2 TEXT,
+            status_timestamp_2 TIMESTAMP,
+            status_3 TEXT,
+            status_timestamp_3 TIMESTAMP,
+            status_4 TEXT,
+            status_timestamp_4 TIMESTAMP,
+            expected_completion_time TIMESTAMP,
+            simulated_network_latency DOUBLE PRECISION,
+            is_floating_cash BOOLEAN DEFAULT FALSE,
+            floating_duration_minutes INTEGER DEFAULT 0,
+            is_fraudulent_attempt BOOLEAN DEFAULT FALSE,
+            is_cancellation BOOLEAN DEFAULT FALSE,
+            is_retry_successful BOOLEAN DEFAULT FALSE,
+            manual_escalation_needed BOOLEAN DEFAULT FALSE,
+            transaction_types TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            message_id INTEGER PRIMARY KEY,
+            transaction_id TEXT NOT NULL,
+            report TEXT
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            wallet_balance NUMERIC(14, 2) DEFAULT 0
+        )
+        """,
+    ]),
+    (2, "retry lineage columns", LINEAGE_DDL),
+    (3, "indexes for tool queries", [
+        # query_user_transactions: user_id = $1 ORDER BY timestamp_initiated DESC
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_initiated
+            ON transactions (user_id, timestamp_initiated DESC)
+        """,
+        # A user's floating transactions, answered from the index alone
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_floating
+            ON transactions (user_id, timestamp_initiated DESC)
+            INCLUDE (transaction_id, amount, floating_duration_minutes)
+            WHERE is_floating_cash
+        """,
+        # Latest reports for a transaction
+        """
+        CREATE INDEX IF NOT EXISTS idx_messages_transaction
+            ON messages (transaction_id, message_id DESC)
+        """,
+    ]),
+    (4, "sequence-backed message_id", [
+        # Reuse an existing serial/identity sequence if the table already has one
+        """
+        DO $$
+        BEGIN
+            IF pg_get_serial_sequence('messages', 'message_id') IS NULL THEN
+                CREATE SEQUENCE messages_message_id_seq OWNED BY messages.message_id;
+                ALTER TABLE messages
+                    ALTER COLUMN message_id SET DEFAULT nextval('messages_message_id_seq');
+            END IF;
+            PERFORM setval(
+                pg_get_serial_sequence('messages', 'message_id'),
+                COALESCE((SELECT MAX(message_id) FROM messages), 0) + 1,
+                false
+            );
+        END $$
+        """,
+    ]),
+    (5, "keyset index for user history pagination", [
+        # Matches USER_HISTORY_ORDER; supersedes idx_transactions_user_initiated
+        """
+        CREATE INDEX IF NOT EXISTS idx_transactions_user_history
+            ON transactions (user_id, timestamp_initiated DESC, transaction_id DESC)
+        """,
+        "DROP INDEX IF EXISTS idx_transactions_user_initiated",
+    ]),
+    (6, "transaction change notifications", CHANGE_FEED_DDL),
+    # Re-creates the notify function so bulk loads can suppress it
+    (7, "bulk load progress", [NOTIFY_FUNCTION, *LOAD_PROGRESS_DDL]),
+    # Events for existing rows come from ``python -m spark_db.status_events``
+    (8, "transaction status events", STATUS_EVENTS_DDL),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Every query the tools run on a hot path, keyed by its metrics name, with
+# representative arguments for EXPLAIN. Only the repository's own statements
+# go here, so the check cannot drift from what the tools actually run.
+TOOL_QUERIES: Dict[str, Tuple[str, Sequence[Any]]] = {
+    "host.query_user_transactions": (
+        USER_HISTORY_FIRST_PAGE,
+        ("user_1", 51),
+    ),
+    "host.query_user_transactions.page": (
+        USER_HISTORY_PAGE,
+        ("user_1", datetime(2024, 1, 1), "TXN_1", 51),
+    ),
+    "host.get_transaction": (
+        SELECT_USER_TRANSACTION,
+        ("TXN_1", "user_1"),
+    ),
+    "host.get_transactions": (
+        SELECT_USER_TRANSACTIONS,
+        (["TXN_1", "TXN_2"], "user_1"),
+    ),
+    "host.flag_floating_cash.batch": (
+        FLAG_FLOATING_CASH_MANY,
+        (["TXN_1", "TXN_2"], ["user_1", "user_1"], [15, 20]),
+    ),
+    "host.flag_floating_cash": (
+        FLAG_FLOATING_CASH,
+        (15, "TXN_1", "user_1"),
+    ),
+    "reconciler.fetch_transaction": (
+        SELECT_TRANSACTION_BY_ID,
+        ("TXN_1",),
+    ),
+    "reconciler.retry": (
+        RETRY_TRANSACTIONS,
+        (["TXN_1", "TXN_2"], None, datetime(2024, 1, 1)),
+    ),
+    "reconciler.transaction_context": (
+        TRANSACTION_CONTEXT,
+        ("TXN_1", 5),
+    ),
+    "escalator.save_report": (
+        SAVE_REPORT,
+        ("TXN_1", "Report #", " for TXN_1", False),
+    ),
+}
+
+
+async def _ensure_version_table(conn: asyncpg.Connection) -> None:
+    await conn.execute("""
+        CREATE TABLE IF NOT EXISTS spark_schema_version (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+        )
+    """)
+
+
+async def current_version(conn: asyncpg.Connection) -> int:
+    """Return the highest applied migration version (0 for a fresh database)."""
+    await _ensure_version_table(conn)
+    return await conn.fetchval("SELECT COALESCE(MAX(version), 0) FROM spark_schema_version")
+
+
+async def migrate(conn: asyncpg.Connection) -> List[int]:
+    """
+    Apply every pending migration.
+
+    Args:
+        conn: Connection to run the migrations on
+
+    Returns:
+        Versions applied by this call
+    """
+    applied: List[int] = []
+    await conn.execute("SELECT pg_advisory_lock($1)", _MIGRATION_LOCK_KEY)
+    try:
+        version = await current_version(conn)
+        for number, description, statements in MIGRATIONS:
+            if number <= version:
+                continue
+            async with conn.transaction():
+                # Index builds may outlast the pool's statement_timeout
+                await conn.execute("SET LOCAL statement_timeout = 0")
+                for statement in statements:
+                    await conn.execute(statement)
+                await conn.execute(
+                    "INSERT INTO spark_schema_version (version, description) VALUES ($1, $2)",
+                    number, description
+                )
+            logger.info("Applied migration %d: %s", number, description)
+            applied.append(number)
+    finally:
+        await conn.execute("SELECT pg_advisory_unlock($1)", _MIGRATION_LOCK_KEY)
+    return applied
+
+
+def _seq_scans(plan: Dict[str, Any]) -> List[str]:
+    """Relations read by a Seq Scan anywhere in an EXPLAIN (FORMAT JSON) plan."""
+    found = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []):
+        found.extend(_seq_scans(child))
+    return found
+
+
+async def check_query_plans(conn: asyncpg.Connection) -> Dict[str, List[str]]:
+    """
+    EXPLAIN every tool query and report the ones that need a sequential scan.
+
+    Sequential scans are disabled for the check, so the planner only picks
+    one when no index can serve the query. This keeps the result independent
+    of table size (the planner legitimately prefers seq scans on tiny tables).
+
+    Returns:
+        Mapping of query name to the relations it seq-scans (empty when clean)
+    """
+    failures: Dict[str, List[str]] = {}
+    async with conn.transaction():
+        await conn.execute("SET LOCAL enable_seqscan = off")
+        for name, (query, args) in TOOL_QUERIES.items():
+            raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {query}", *args)
+            plan = json.loads(raw)[0]["Plan"]
+            scans = _seq_scans(plan)
+            if scans:
+                failures[name] = scans
+    return failures
+
+
+async def run_migrations() -> None:
+    """
+    Apply pending migrations from an agent's startup hook.
+
+    Disabled by setting ``DB_AUTO_MIGRATE=false``. Failures are logged rather
+    than raised so that an agent can still start against a database it is
+    not allowed to alter.
+    """
+    if os.getenv('DB_AUTO_MIGRATE', 'true').lower() in ('0', 'false', 'no'):
+        return
+    try:
+        async with acquire() as conn:
+            applied = await migrate(conn)
+        if applied:
+            logger.info("Database schema now at version %d", LATEST_VERSION)
+    except Exception as e:
+        logger.warning("Database migration skipped: %s", e)
+
+
+async def _main(check: bool) -> int:
+    try:
+        async with acquire() as conn:
+            applied = await migrate(conn)
+            print(f"Schema at version {await current_version(conn)} "
+                  f"(applied: {applied or 'none'})")
+            if not check:
+                return 0
+            failures = await check_query_plans(conn)
+    finally:
+        await close_pool()
+
+    for name in TOOL_QUERIES:
+        status = f"SEQ SCAN on {', '.join(failures[name])}" if name in failures else "ok"
+        print(f"  {name}: {status}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply SPARK schema migrations")
+    parser.add_argument(
+        "--check", action="store_true",
+        help="EXPLAIN every tool query and exit non-zero if any needs a sequential scan"
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    sys.exit(asyncio.run(_main(args.check)))
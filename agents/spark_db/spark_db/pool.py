@@ -0,0 +1,241 @@
+"""
+Process-wide asyncpg connection pool shared by the SPARK agents.
+
+Every tool acquires its connection from here instead of calling
+``asyncpg.connect`` per query, so the TCP/TLS/auth handshake is paid once per
+pooled connection instead of once per tool call. Each new connection gets the
+codecs from ``spark_db.encoding``, so rows decode straight to JSON-ready values.
+
+When ``DB_READ_HOST`` names a read replica, a second pool is opened against
+it and callers pick one per statement with ``role``: :data:`PRIMARY` for
+writes (and the default), :data:`REPLICA` for reads that tolerate a little
+replication lag. Without a replica both roles share the primary's pool.
+
+Environment:
+    DB_NAME, DB_HOST, DB_PORT, DB_USER, DB_PASSWORD  Connection settings
+    DB_READ_HOST, DB_READ_PORT  Read replica (optional; same database and credentials)
+    DB_POOL_MIN_SIZE           Connections opened (prewarmed) up front (default 2)
+    DB_POOL_MAX_SIZE           Upper bound on open connections (default 10)
+    DB_POOL_MAX_IDLE_SECONDS   Idle connections are closed after this (default 300)
+    DB_POOL_MAX_QUERIES        Connections are recycled after this many queries (default 50000)
+    DB_CONNECT_RETRIES         Attempts when (re)connecting fails (default 3)
+    DB_STATEMENT_TIMEOUT_MS    Server-side statement_timeout per connection (default 30000)
+
+Statements also observe the request deadline from ``spark_db.deadline``.
+Timeouts are never retried: the time is already spent.
+"""
+
+import asyncio
+import logging
+import os
+import time
+import weakref
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, TypeVar
+
+import asyncpg
+from dotenv import load_dotenv
+
+from .deadline import remaining
+from .encoding import install_codecs
+from .metrics import TracedConnection, registry
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+PRIMARY = "primary"
+REPLICA = "replica"
+
+# Errors meaning the connection itself is gone, as opposed to a failed statement.
+# Operations hitting one of these are retried on a fresh connection. From
+# Python 3.11 asyncio.TimeoutError is an OSError too, so callers that treat
+# timeouts differently catch it first; before 3.11 it must be caught on its own.
+CONNECTION_ERRORS = (
+    OSError,
+    asyncpg.exceptions.PostgresConnectionError,
+    asyncpg.exceptions.CannotConnectNowError,
+    asyncpg.exceptions.AdminShutdownError,
+    asyncpg.exceptions.TooManyConnectionsError,
+)
+
+# asyncpg pools are bound to the event loop that created them; one per role
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, asyncpg.Pool]]" = weakref.WeakKeyDictionary()
+_pool_locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+def replica_configured() -> bool:
+    """Whether a read replica is configured."""
+    return bool(os.getenv('DB_READ_HOST'))
+
+
+def _resolve_role(role: str) -> str:
+    if role not in (PRIMARY, REPLICA):
+        raise ValueError(f"Unknown database role {role!r}")
+    return role if replica_configured() else PRIMARY
+
+
+def db_config(role: str = PRIMARY) -> Dict[str, Any]:
+    """Connection settings for the SPARK PostgreSQL database (or its read replica)."""
+    config = {
+        'database': os.getenv('DB_NAME'),
+        'host': os.getenv('DB_HOST'),
+        'port': int(os.getenv('DB_PORT', 5432)),
+        'user': os.getenv('DB_USER'),
+        'password': os.getenv('DB_PASSWORD')
+    }
+    if _resolve_role(role) == REPLICA:
+        config['host'] = os.getenv('DB_READ_HOST')
+        config['port'] = int(os.getenv('DB_READ_PORT') or config['port'])
+    return config
+
+
+def pool_settings() -> Dict[str, Any]:
+    """Pool sizing and recycling settings, read from the environment."""
+    min_size = _env_int('DB_POOL_MIN_SIZE', 2)
+    return {
+        'min_size': min_size,
+        'max_size': max(min_size, _env_int('DB_POOL_MAX_SIZE', 10)),
+        'max_inactive_connection_lifetime': _env_float('DB_POOL_MAX_IDLE_SECONDS', 300.0),
+        'max_queries': _env_int('DB_POOL_MAX_QUERIES', 50000),
+    }
+
+
+async def _create_pool(role: str) -> asyncpg.Pool:
+    """Create a pool, retrying with backoff while the database is unreachable."""
+    attempts = max(1, _env_int('DB_CONNECT_RETRIES', 3))
+    delay = 0.5
+    for attempt in range(1, attempts + 1):
+        try:
+            pool = await asyncpg.create_pool(
+                **db_config(role),
+                **pool_settings(),
+                init=install_codecs,
+                server_settings={
+                    # The timestamp codec relies on ISO text output
+                    'DateStyle': 'ISO, MDY',
+                    'statement_timeout': str(_env_int('DB_STATEMENT_TIMEOUT_MS', 30000)),
+                },
+            )
+            logger.info("Database %s pool ready (%s)", role, pool_settings())
+            return pool
+        except (*CONNECTION_ERRORS, asyncio.TimeoutError) as e:
+            if attempt == attempts:
+                raise
+            logger.warning(
+                "Database %s connection failed (attempt %d/%d): %s", role, attempt, attempts, e
+            )
+            await asyncio.sleep(delay)
+            delay *= 2
+    raise RuntimeError("unreachable")
+
+
+async def get_pool(role: str = PRIMARY) -> asyncpg.Pool:
+    """
+    Return the ``role`` pool for the running event loop, creating it on first use.
+
+    Creating the pool opens ``DB_POOL_MIN_SIZE`` connections, so calling this
+    during startup prewarms the pool before the first tool call.
+    """
+    role = _resolve_role(role)
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop, {}).get(role)
+    if pool is not None and not pool.is_closing():
+        return pool
+
+    lock = _pool_locks.setdefault(loop, asyncio.Lock())
+    async with lock:
+        pools = _pools.setdefault(loop, {})
+        pool = pools.get(role)
+        if pool is None or pool.is_closing():
+            pool = await _create_pool(role)
+            pools[role] = pool
+        return pool
+
+
+async def close_pool() -> None:
+    """Close the pools bound to the running event loop, if any."""
+    pools = _pools.pop(asyncio.get_running_loop(), {})
+    for pool in pools.values():
+        await pool.close()
+
+
+@asynccontextmanager
+async def acquire(
+    role: str = PRIMARY,
+    name: Optional[str] = None
+) -> AsyncIterator[asyncpg.Connection]:
+    """
+    Borrow a connection from the ``role`` pool for the duration of the block.
+
+    With a ``name`` the connection is a :class:`~spark_db.metrics.TracedConnection`
+    recording its statements (and the wait for the connection) under that name.
+    """
+    pool = await get_pool(role)
+    start = time.perf_counter()
+    async with pool.acquire(timeout=remaining()) as conn:
+        if name is None:
+            yield conn
+        else:
+            registry.observe_pool_wait(name, (time.perf_counter() - start) * 1000)
+            yield TracedConnection(conn, name)
+
+
+async def with_connection(
+    operation: Callable[[asyncpg.Connection], Awaitable[T]],
+    role: str = PRIMARY,
+    name: Optional[str] = None
+) -> T:
+    """
+    Run ``operation`` on a pooled connection, reconnecting if the connection drops.
+
+    When the server goes away (restart, failover, idle kill), every connection
+    in the pool is expired and the operation is retried on a fresh one. Only
+    pass operations that are safe to repeat: reads, or writes wrapped in a
+    single transaction.
+
+    Args:
+        operation: Coroutine function taking a connection
+        role: :data:`PRIMARY` or :data:`REPLICA`
+        name: Metrics name for the operation's statements (see ``spark_db.metrics``)
+
+    Returns:
+        Whatever ``operation`` returns
+    """
+    attempts = max(1, _env_int('DB_CONNECT_RETRIES', 3))
+    delay = 0.2
+    for attempt in range(1, attempts + 1):
+        try:
+            async with acquire(role, name) as conn:
+                return await operation(conn)
+        except asyncio.TimeoutError:
+            raise
+        except CONNECTION_ERRORS as e:
+            if attempt == attempts:
+                raise
+            logger.warning("Lost database connection (%s); reconnecting", e)
+            await (await get_pool(role)).expire_connections()
+            await asyncio.sleep(delay)
+            delay *= 2
+    raise RuntimeError("unreachable")
+
+
+async def prewarm() -> None:
+    """Open the pools' minimum connections ahead of the first tool call."""
+    for role in (PRIMARY, REPLICA) if replica_configured() else (PRIMARY,):
+        try:
+            await get_pool(role)
+        except Exception as e:
+            logger.warning("Database %s pool prewarm failed, will retry on first use: %s", role, e)
@@ -0,0 +1,839 @@
+"""
+Access to the ``transactions`` and ``messages`` tables.
+
+Tools look transactions up by primary key here instead of listing a user's
+recent history and scanning it in Python, which both cost a full page of
+26-column rows and missed anything older than that page.
+
+:class:`TransactionRepository` is the interface every tool goes through.
+``DB_BACKEND`` picks the implementation returned by :func:`get_repository`:
+
+    postgres  :class:`PostgresTransactionRepository` (default)
+    sqlite    ``spark_db.sqlite.SQLiteTransactionRepository``, an embedded
+              stand-in for benchmarks and load tests without a database
+              server; ``DB_SQLITE_PATH`` names its file (default in-memory)
+"""
+
+import asyncio
+import base64
+import binascii
+import json
+import os
+from abc import ABC, abstractmethod
+from datetime import datetime, timedelta
+from typing import (
+    Any, AsyncIterator, Awaitable, Callable, Dict, List, Mapping, Optional, Sequence, Tuple, TypeVar
+)
+
+from .encoding import parse_timestamp, records_to_dicts
+from .pool import CONNECTION_ERRORS, REPLICA, acquire, close_pool, prewarm, with_connection
+from .routing import create_router
+from .status_events import STATUS_TIMELINE_ORDER, legacy_timeline
+
+T = TypeVar("T")
+
+# Columns every tool reads for a transaction, in table order
+TRANSACTION_COLUMNS = [
+    "transaction_id",
+    "user_id",
+    "amount",
+    "transaction_type",
+    "recipient_type",
+    "recipient_account_id",
+    "recipient_bank_name_or_ewallet",
+    "device_id",
+    "location_coordinates",
+    "timestamp_initiated",
+    "status_1",
+    "status_timestamp_1",
+    "status_2",
+    "status_timestamp_2",
+    "status_3",
+    "status_timestamp_3",
+    "status_4",
+    "status_timestamp_4",
+    "expected_completion_time",
+    "simulated_network_latency",
+    "is_floating_cash",
+    "floating_duration_minutes",
+    "is_fraudulent_attempt",
+    "is_cancellation",
+    "is_retry_successful",
+    "manual_escalation_needed",
+    # Latest status, maintained alongside status_1..4 (spark_db.status_events)
+    "current_status",
+]
+
+# Lineage columns written alongside TRANSACTION_COLUMNS for retry rows
+RETRY_COLUMNS = TRANSACTION_COLUMNS + ["parent_transaction_id", "retry_number"]
+
+# Retries allowed per original transaction
+MAX_RETRIES = 2
+
+SELECT_TRANSACTION = f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions"
+
+# One transaction by ID, and one or several scoped to their owner
+SELECT_TRANSACTION_BY_ID = f"{SELECT_TRANSACTION} WHERE transaction_id = $1"
+SELECT_USER_TRANSACTION = f"{SELECT_TRANSACTION} WHERE transaction_id = $1 AND user_id = $2"
+SELECT_USER_TRANSACTIONS = (
+    f"{SELECT_TRANSACTION} WHERE transaction_id = ANY($1::text[]) AND user_id = $2"
+)
+
+# A user's history, newest first, with a unique tie-breaker so keyset
+# pagination never skips or repeats rows sharing a timestamp
+USER_HISTORY_ORDER = "ORDER BY timestamp_initiated DESC, transaction_id DESC"
+
+# First page of a user's history
+USER_HISTORY_FIRST_PAGE = f"{SELECT_TRANSACTION} WHERE user_id = $1 {USER_HISTORY_ORDER} LIMIT $2"
+
+# Keyset page: rows strictly after ($2, $3) in USER_HISTORY_ORDER
+USER_HISTORY_PAGE = f"""
+    {SELECT_TRANSACTION}
+    WHERE user_id = $1 AND (timestamp_initiated, transaction_id) < ($2, $3)
+    {USER_HISTORY_ORDER}
+    LIMIT $4
+"""
+
+# Transaction row plus its retry attempts and latest report previews, built
+# server-side so callers need a single round trip. $2 limits the reports.
+TRANSACTION_CONTEXT = f"""
+    SELECT {', '.join('t.' + column for column in TRANSACTION_COLUMNS)},
+           retries.attempts AS retry_attempts,
+           retries.total AS retry_count,
+           reports.previews AS report_previews,
+           timeline.events AS status_timeline
+    FROM transactions t
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(
+                   jsonb_agg(to_jsonb(rt) - 'retry_number' ORDER BY rt.retry_number),
+                   '[]'::jsonb
+               ) AS attempts,
+               count(*) AS total
+        FROM (
+            SELECT retry_number, {', '.join(TRANSACTION_COLUMNS)}
+            FROM transactions
+            WHERE parent_transaction_id = t.transaction_id
+        ) rt
+    ) retries
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(
+                   json_agg(json_build_object(
+                       'message_id', m.message_id,
+                       'report_preview', left(m.report, 500)
+                   ) ORDER BY m.message_id DESC),
+                   '[]'::json
+               ) AS previews
+        FROM (
+            SELECT message_id, report
+            FROM messages
+            WHERE transaction_id = t.transaction_id
+            ORDER BY message_id DESC
+            LIMIT $2
+        ) m
+    ) reports
+    CROSS JOIN LATERAL (
+        SELECT COALESCE(
+                   json_agg(json_build_object('status', e.status, 'ts', e.ts)
+                            {STATUS_TIMELINE_ORDER}),
+                   '[]'::json
+               ) AS events
+        FROM transaction_status_events e
+        WHERE e.transaction_id = t.transaction_id
+    ) timeline
+    WHERE t.transaction_id = $1
+"""
+
+FLAG_FLOATING_CASH = """
+    UPDATE transactions
+    SET is_floating_cash = TRUE,
+        floating_duration_minutes = $1
+    WHERE transaction_id = $2 AND user_id = $3
+"""
+
+# Bulk floating-cash flags: one row per ($1[i], $2[i], $3[i])
+FLAG_FLOATING_CASH_MANY = """
+    UPDATE transactions t
+    SET is_floating_cash = TRUE,
+        floating_duration_minutes = f.duration
+    FROM UNNEST($1::text[], $2::text[], $3::int[]) AS f(transaction_id, user_id, duration)
+    WHERE t.transaction_id = f.transaction_id AND t.user_id = f.user_id
+"""
+
+# Retries accepted by one create_retries call
+MAX_RETRY_BATCH = 500
+
+# SQL for the retry row columns retry_row() sets; $3 is the retry time.
+# Keep the two in step.
+_RETRY_VALUES = {
+    "transaction_id": "'RT' || (o.retry_count + 1) || '_' || o.transaction_id",
+    "timestamp_initiated": "$3::timestamp",
+    "status_1": "'initiated'",
+    "status_timestamp_1": "$3::timestamp",
+    "status_2": "'processing'",
+    "status_timestamp_2": "$3::timestamp + interval '30 seconds'",
+    "status_3": "'completed'",
+    "status_timestamp_3": "$3::timestamp + interval '2 minutes'",
+    "status_4": "'settled'",
+    "status_timestamp_4": "$3::timestamp + interval '5 minutes'",
+    "expected_completion_time": "$3::timestamp + interval '5 minutes'",
+    "simulated_network_latency": "2.5",
+    "is_floating_cash": "FALSE",
+    "floating_duration_minutes": "0",
+    "is_fraudulent_attempt": "FALSE",
+    "is_cancellation": "FALSE",
+    "is_retry_successful": "TRUE",
+    "manual_escalation_needed": "FALSE",
+    "current_status": "'settled'",
+    "parent_transaction_id": "o.transaction_id",
+    "retry_number": "o.retry_count + 1",
+}
+
+# Retry every eligible transaction in $1 (owned by $2 when it is not null)
+# in one statement: lock the originals and read their retry counts, insert
+# one RTn_ row per eligible original, and resolve the originals whose retry
+# row went in. The row locks (taken in ID order, so overlapping batches
+# cannot deadlock) make a concurrent retry of the same transaction wait and
+# then see it resolved; ON CONFLICT covers a retry row that appeared anyway.
+# One row comes back per original found, with the new retry's ID when one
+# was inserted.
+RETRY_TRANSACTIONS = f"""
+    WITH requested AS (
+        SELECT t.transaction_id, t.user_id, t.is_floating_cash, t.is_retry_successful,
+               (SELECT COUNT(*) FROM transactions r
+                WHERE r.parent_transaction_id = t.transaction_id) AS retry_count
+        FROM transactions t
+        WHERE t.transaction_id = ANY($1::text[])
+          AND ($2::text IS NULL OR t.user_id = $2)
+        ORDER BY t.transaction_id
+        FOR UPDATE OF t
+    ), inserted AS (
+        INSERT INTO transactions ({', '.join(RETRY_COLUMNS)})
+        SELECT {', '.join(_RETRY_VALUES.get(column, f"t.{column}") for column in RETRY_COLUMNS)}
+        FROM requested o
+        JOIN transactions t ON t.transaction_id = o.transaction_id
+        WHERE o.is_floating_cash
+          AND NOT COALESCE(o.is_retry_successful, FALSE)
+          AND o.retry_count < {MAX_RETRIES}
+        ON CONFLICT (transaction_id) DO NOTHING
+        RETURNING parent_transaction_id, transaction_id, retry_number
+    ), resolved AS (
+        UPDATE transactions t
+        SET is_retry_successful = TRUE,
+            manual_escalation_needed = FALSE
+        FROM inserted i
+        WHERE t.transaction_id = i.parent_transaction_id
+    )
+    SELECT o.transaction_id, o.user_id, o.is_floating_cash, o.is_retry_successful,
+           o.retry_count, i.transaction_id AS new_transaction_id, i.retry_number
+    FROM requested o
+    LEFT JOIN inserted i ON i.parent_transaction_id = o.transaction_id
+"""
+
+# Take the next message_id from the sequence, save the report with the ID
+# spliced in between $2 and $3, and flag the transaction for escalation when
+# $4 is set, all in a single atomic statement
+SAVE_REPORT = """
+    WITH next_id AS (
+        SELECT nextval(pg_get_serial_sequence('messages', 'message_id')) AS message_id
+    ), saved AS (
+        INSERT INTO messages (message_id, transaction_id, report)
+        SELECT message_id, $1, $2::text || message_id || $3::text
+        FROM next_id
+        RETURNING message_id
+    ), escalated AS (
+        UPDATE transactions
+        SET manual_escalation_needed = TRUE
+        WHERE transaction_id = $1 AND $4::boolean
+        RETURNING transaction_id
+    )
+    SELECT message_id FROM saved
+"""
+
+
+def encode_cursor(row: Dict[str, Any]) -> str:
+    """Opaque continuation token pointing just past ``row`` in a user's history."""
+    key = [row["timestamp_initiated"], row["transaction_id"]]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[str, str]:
+    """
+    Decode a token produced by :func:`encode_cursor`.
+
+    Raises:
+        ValueError: If the token is malformed
+    """
+    try:
+        timestamp, transaction_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        # Validate before it reaches the query as a timestamp parameter
+        parse_timestamp(timestamp)
+        return timestamp, str(transaction_id)
+    except (binascii.Error, TypeError, ValueError) as e:
+        raise ValueError(f"Invalid pagination cursor: {cursor!r}") from e
+
+
+def retry_row(original: Dict[str, Any], retry_number: int, now: datetime) -> Dict[str, Any]:
+    """
+    Values for a retry of ``original``, keyed by :data:`RETRY_COLUMNS`.
+
+    Retries are simulated to settle within five minutes, so the row is
+    written already completed and marked successful. The Postgres backend
+    builds the same row in SQL (:data:`RETRY_TRANSACTIONS`).
+    """
+    row = {column: original.get(column) for column in TRANSACTION_COLUMNS}
+    row.update({
+        "transaction_id": f"RT{retry_number}_{original['transaction_id']}",
+        "timestamp_initiated": now.isoformat(),
+        "status_1": "initiated",
+        "status_timestamp_1": now.isoformat(),
+        "status_2": "processing",
+        "status_timestamp_2": (now + timedelta(seconds=30)).isoformat(),
+        "status_3": "completed",
+        "status_timestamp_3": (now + timedelta(minutes=2)).isoformat(),
+        "status_4": "settled",
+        "status_timestamp_4": (now + timedelta(minutes=5)).isoformat(),
+        "expected_completion_time": (now + timedelta(minutes=5)).isoformat(),
+        "simulated_network_latency": 2.5,
+        "is_floating_cash": False,
+        "floating_duration_minutes": 0,
+        "is_fraudulent_attempt": False,
+        "is_cancellation": False,
+        "is_retry_successful": True,
+        "manual_escalation_needed": False,
+        "current_status": "settled",
+        "parent_transaction_id": original["transaction_id"],
+        "retry_number": retry_number,
+    })
+    return row
+
+
+def _retry_result(row: Optional[Mapping[str, Any]], now: datetime) -> Dict[str, Any]:
+    """:meth:`TransactionRepository.create_retry` result for a row of :data:`RETRY_TRANSACTIONS`."""
+    if row is None:
+        return {"status": "not_found"}
+    if not row["is_floating_cash"]:
+        return {"status": "no_discrepancy"}
+    if row["is_retry_successful"]:
+        return {"status": "already_resolved"}
+    if row["retry_count"] >= MAX_RETRIES:
+        return {"status": "limit_reached", "retry_count": row["retry_count"]}
+    if row["new_transaction_id"] is None:
+        # A concurrent retry inserted this retry row first
+        return {"status": "already_resolved"}
+    return {
+        "status": "success",
+        "user_id": row["user_id"],
+        "new_transaction_id": row["new_transaction_id"],
+        "retry_number": row["retry_number"],
+        "timestamp": now.isoformat(),
+    }
+
+
+class TransactionRepository(ABC):
+    """
+    Storage interface for the SPARK tools.
+
+    Reads are always scoped to the owning user when one is given. Rows come
+    back JSON-ready: amounts as floats and timestamps as ISO 8601 strings.
+    """
+
+    @abstractmethod
+    async def get_transaction(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fetch one transaction by primary key.
+
+        Args:
+            transaction_id: The transaction ID to fetch
+            user_id: Owning user; when given, other users' rows are never returned
+
+        Returns:
+            The transaction row as a dict, or None if not found
+        """
+
+    @abstractmethod
+    async def get_transactions(
+        self,
+        transaction_ids: Sequence[str],
+        user_id: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Fetch several of a user's transactions at once.
+
+        Args:
+            transaction_ids: Transaction IDs to fetch
+            user_id: Owning user
+
+        Returns:
+            Rows found, in the order of ``transaction_ids``; unknown IDs are skipped
+        """
+
+    @abstractmethod
+    async def get_transaction_context(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None,
+        report_limit: int = 5
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Fetch a transaction with its retries and recent reports.
+
+        Args:
+            transaction_id: The transaction ID to fetch
+            user_id: Owning user; when given, other users' rows are never returned
+            report_limit: Number of latest report previews to include
+
+        Returns:
+            Dict with ``transaction`` (row dict), ``retry_attempts`` (row dicts,
+            oldest first), ``retry_count``, ``report_previews``
+            (``message_id`` and the first 500 characters, newest first) and
+            ``status_timeline`` (``status`` and ``ts`` events, oldest first),
+            or None if the transaction is not found
+        """
+
+    @abstractmethod
+    async def list_user_transactions(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """
+        Fetch one page of a user's transactions, newest first.
+
+        Pages are addressed by keyset on ``(timestamp_initiated, transaction_id)``
+        rather than OFFSET, so every page costs the same index range scan no
+        matter how deep into the history it is.
+
+        Args:
+            user_id: Owning user
+            limit: Maximum rows in the page
+            cursor: Token from a previous page; None starts at the newest row
+
+        Returns:
+            The page's rows and the token for the next page (None on the last page)
+        """
+
+    @abstractmethod
+    def stream_user_transactions(
+        self,
+        user_id: str,
+        prefetch: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Iterate over all of a user's transactions, newest first.
+
+        Rows are read ``prefetch`` at a time, so memory stays flat regardless
+        of history size.
+
+        Args:
+            user_id: Owning user
+            prefetch: Rows fetched per round trip
+
+        Yields:
+            Transaction rows as dicts
+        """
+
+    @abstractmethod
+    async def flag_floating_cash(
+        self,
+        transaction_id: str,
+        user_id: str,
+        floating_duration_minutes: int
+    ) -> bool:
+        """
+        Mark a user's transaction as floating cash.
+
+        Args:
+            transaction_id: The transaction to flag
+            user_id: Owning user
+            floating_duration_minutes: How long the cash has been floating
+
+        Returns:
+            True if a row was updated
+        """
+
+    @abstractmethod
+    async def flag_floating_cash_many(
+        self,
+        flags: Sequence[Tuple[str, str, int]]
+    ) -> int:
+        """
+        Mark many transactions as floating cash in one statement.
+
+        Args:
+            flags: ``(transaction_id, user_id, floating_duration_minutes)``
+                tuples, at most one per transaction
+
+        Returns:
+            Number of rows updated
+        """
+
+    @abstractmethod
+    async def create_retry(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Record a retry of a floating transaction, atomically.
+
+        Inserts the ``RTn_`` row built by :func:`retry_row` and marks the
+        original as successfully retried, unless the transaction is unknown,
+        not floating, already resolved, or out of retries.
+
+        Args:
+            transaction_id: The original transaction ID
+            user_id: Owning user; when given, other users' rows are never retried
+
+        Returns:
+            Dict with ``status`` (``success``, ``not_found``, ``no_discrepancy``,
+            ``already_resolved`` or ``limit_reached``); on success also
+            ``new_transaction_id``, ``retry_number``, ``timestamp`` and the
+            owning ``user_id``, and on ``limit_reached`` the ``retry_count``
+        """
+
+    @abstractmethod
+    async def create_retries(
+        self,
+        transaction_ids: Sequence[str],
+        user_id: Optional[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        Retry many floating transactions in one DB transaction.
+
+        Each transaction is checked and retried exactly as :meth:`create_retry`
+        would, but all ``RTn_`` rows are inserted and all originals resolved
+        together.
+
+        Args:
+            transaction_ids: Original transaction IDs, at most
+                :data:`MAX_RETRY_BATCH`; duplicates are retried once
+            user_id: Owning user; when given, other users' rows are never retried
+
+        Returns:
+            :meth:`create_retry` result per transaction ID, in request order
+        """
+
+    @abstractmethod
+    async def save_report(
+        self,
+        transaction_id: str,
+        report_prefix: str,
+        report_suffix: str,
+        escalate: bool
+    ) -> int:
+        """
+        Save a report under a newly assigned message ID.
+
+        The stored report is ``report_prefix + str(message_id) + report_suffix``,
+        so the report can quote its own ID.
+
+        Args:
+            transaction_id: The transaction the report is for
+            report_prefix: Report text before the message ID
+            report_suffix: Report text after the message ID
+            escalate: Also set ``manual_escalation_needed`` on the transaction
+
+        Returns:
+            The new message ID
+        """
+
+    def invalidate(
+        self,
+        transaction_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> None:
+        """
+        Forget cached reads after a write made outside this repository.
+
+        The cache (``spark_db.cache``) drops its entries and the Postgres
+        backend reads the affected rows from the primary for a while; a
+        no-op otherwise.
+
+        Args:
+            transaction_id: Drop reads involving this transaction
+            user_id: Drop reads of this user's transactions
+        """
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Cache hit/miss counters, or None when reads are not cached."""
+        return None
+
+    async def prepare(self) -> None:
+        """Get the backend ready to serve; called from the agents' startup hooks."""
+
+    async def close(self) -> None:
+        """Release the backend's connections; called on shutdown."""
+
+
+class PostgresTransactionRepository(TransactionRepository):
+    """
+    Repository backed by the shared asyncpg pool.
+
+    Writes go to the primary. Reads go wherever the
+    :class:`~spark_db.routing.ReplicaRouter` sends them, which is the read
+    replica when one is configured and fresh enough.
+    """
+
+    def __init__(self):
+        self.router = create_router()
+
+    async def _read(
+        self,
+        name: str,
+        operation: Callable[[Any], Awaitable[T]],
+        transaction_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> T:
+        if await self.router.read_role(transaction_id, user_id) == REPLICA:
+            try:
+                return await with_connection(operation, role=REPLICA, name=name)
+            except asyncio.TimeoutError:
+                raise
+            except CONNECTION_ERRORS:
+                self.router.mark_unavailable()
+        return await with_connection(operation, name=name)
+
+    async def get_transaction(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        if user_id:
+            name = "host.get_transaction"
+            query = SELECT_USER_TRANSACTION
+            args: Sequence[Any] = (transaction_id, user_id)
+        else:
+            name = "reconciler.fetch_transaction"
+            query = SELECT_TRANSACTION_BY_ID
+            args = (transaction_id,)
+
+        row = await self._read(
+            name, lambda conn: conn.fetchrow(query, *args), transaction_id, user_id
+        )
+        return dict(row) if row else None
+
+    async def get_transactions(
+        self,
+        transaction_ids: Sequence[str],
+        user_id: str
+    ) -> List[Dict[str, Any]]:
+        if not transaction_ids:
+            return []
+
+        rows = await self._read(
+            "host.get_transactions",
+            lambda conn: conn.fetch(SELECT_USER_TRANSACTIONS, list(transaction_ids), user_id),
+            user_id=user_id
+        )
+        by_id = {row["transaction_id"]: row for row in records_to_dicts(rows)}
+        return [by_id[txn_id] for txn_id in transaction_ids if txn_id in by_id]
+
+    async def get_transaction_context(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None,
+        report_limit: int = 5
+    ) -> Optional[Dict[str, Any]]:
+        # One round trip: retries and reports are aggregated server-side
+        query = TRANSACTION_CONTEXT
+        args: List[Any] = [transaction_id, report_limit]
+        if user_id:
+            query += " AND t.user_id = $3"
+            args.append(user_id)
+
+        row = await self._read(
+            "reconciler.transaction_context",
+            lambda conn: conn.fetchrow(query, *args), transaction_id, user_id
+        )
+        if row is None:
+            return None
+
+        return {
+            "transaction": {column: row[column] for column in TRANSACTION_COLUMNS},
+            "retry_attempts": json.loads(row["retry_attempts"]),
+            "retry_count": row["retry_count"],
+            "report_previews": json.loads(row["report_previews"]),
+            # Rows the status backfill has not reached yet have no events
+            "status_timeline": json.loads(row["status_timeline"]) or legacy_timeline(row),
+        }
+
+    async def list_user_transactions(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        if cursor:
+            timestamp, transaction_id = decode_cursor(cursor)
+            name = "host.query_user_transactions.page"
+            query = USER_HISTORY_PAGE
+            args: Sequence[Any] = (user_id, timestamp, transaction_id, limit + 1)
+        else:
+            name = "host.query_user_transactions"
+            query = USER_HISTORY_FIRST_PAGE
+            args = (user_id, limit + 1)
+
+        rows = await self._read(name, lambda conn: conn.fetch(query, *args), user_id=user_id)
+        page = records_to_dicts(rows[:limit])
+        next_cursor = encode_cursor(page[-1]) if len(rows) > limit else None
+        return page, next_cursor
+
+    async def stream_user_transactions(
+        self,
+        user_id: str,
+        prefetch: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        # Server-side cursor; holds a pooled connection until iteration
+        # finishes or the generator is closed
+        query = f"{SELECT_TRANSACTION} WHERE user_id = $1 {USER_HISTORY_ORDER}"
+        role = await self.router.read_role(user_id=user_id)
+        async with acquire(role, name="host.stream_user_transactions") as conn:
+            async with conn.transaction(readonly=True):
+                async for row in conn.cursor(query, user_id, prefetch=prefetch):
+                    yield dict(row)
+
+    async def flag_floating_cash(
+        self,
+        transaction_id: str,
+        user_id: str,
+        floating_duration_minutes: int
+    ) -> bool:
+        status = await with_connection(lambda conn: conn.execute(
+            FLAG_FLOATING_CASH, floating_duration_minutes, transaction_id, user_id
+        ), name="host.flag_floating_cash")
+        self.router.pin(transaction_id, user_id)
+        return status != "UPDATE 0"
+
+    async def flag_floating_cash_many(
+        self,
+        flags: Sequence[Tuple[str, str, int]]
+    ) -> int:
+        if not flags:
+            return 0
+        transaction_ids, user_ids, durations = (list(column) for column in zip(*flags))
+        status = await with_connection(lambda conn: conn.execute(
+            FLAG_FLOATING_CASH_MANY, transaction_ids, user_ids, durations
+        ), name="host.flag_floating_cash.batch")
+        for transaction_id, user_id in zip(transaction_ids, user_ids):
+            self.router.pin(transaction_id, user_id)
+        return int(status.split()[-1])
+
+    async def create_retry(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        results = await self._retry([transaction_id], user_id, "reconciler.retry")
+        return results[transaction_id]
+
+    async def create_retries(
+        self,
+        transaction_ids: Sequence[str],
+        user_id: Optional[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        transaction_ids = list(dict.fromkeys(transaction_ids))
+        if len(transaction_ids) > MAX_RETRY_BATCH:
+            raise ValueError(f"At most {MAX_RETRY_BATCH} transactions can be retried at once")
+        if not transaction_ids:
+            return {}
+        return await self._retry(transaction_ids, user_id, "reconciler.retry.batch")
+
+    async def _retry(
+        self,
+        transaction_ids: List[str],
+        user_id: Optional[str],
+        name: str
+    ) -> Dict[str, Dict[str, Any]]:
+        now = datetime.now()
+        # A single statement commits or fails as a whole, so it is safe to
+        # re-run on a fresh pooled connection if the current one drops
+        rows = await with_connection(lambda conn: conn.fetch(
+            RETRY_TRANSACTIONS, transaction_ids, user_id, now
+        ), name=name)
+
+        found = {row["transaction_id"]: row for row in rows}
+        results = {}
+        for transaction_id in transaction_ids:
+            results[transaction_id] = result = _retry_result(found.get(transaction_id), now)
+            if result["status"] == "success":
+                # Read the new retry row and resolved original back from the primary
+                self.router.pin(transaction_id, result["user_id"])
+        return results
+
+    async def save_report(
+        self,
+        transaction_id: str,
+        report_prefix: str,
+        report_suffix: str,
+        escalate: bool
+    ) -> int:
+        async with acquire(name="escalator.save_report") as conn:
+            message_id = await conn.fetchval(
+                SAVE_REPORT, transaction_id, report_prefix, report_suffix, escalate
+            )
+        self.router.pin(transaction_id)
+        return message_id
+
+    def invalidate(
+        self,
+        transaction_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> None:
+        # Changed elsewhere; the replica may not have it yet
+        self.router.pin(transaction_id, user_id)
+
+    async def prepare(self) -> None:
+        # Imported here: migrations builds its plan check from this module
+        from .migrations import run_migrations
+
+        await prewarm()
+        await run_migrations()
+
+    async def close(self) -> None:
+        await close_pool()
+
+
+_repository: Optional[TransactionRepository] = None
+
+
+def create_repository(backend: Optional[str] = None) -> TransactionRepository:
+    """
+    Build a repository for ``backend`` (defaults to ``DB_BACKEND``).
+
+    Reads are cached per process unless ``DB_CACHE_TTL_SECONDS`` is 0.
+
+    Raises:
+        ValueError: If the backend is unknown
+    """
+    backend = (backend or os.getenv('DB_BACKEND') or 'postgres').lower()
+    repository: TransactionRepository
+    if backend == 'postgres':
+        repository = PostgresTransactionRepository()
+    elif backend == 'sqlite':
+        from .sqlite import SQLiteTransactionRepository
+
+        repository = SQLiteTransactionRepository(os.getenv('DB_SQLITE_PATH') or ':memory:')
+    else:
+        raise ValueError(f"Unknown DB_BACKEND {backend!r}; expected 'postgres' or 'sqlite'")
+
+    ttl = float(os.getenv('DB_CACHE_TTL_SECONDS') or 30)
+    if ttl > 0:
+        from .cache import CachedTransactionRepository
+
+        repository = CachedTransactionRepository(
+            repository, ttl, int(os.getenv('DB_CACHE_MAX_ENTRIES') or 1024)
+        )
+    return repository
+
+
+def get_repository() -> TransactionRepository:
+    """Return the process-wide transaction repository."""
+    global _repository
+    if _repository is None:
+        _repository = create_repository()
+    return _repository
@@ -0,0 +1,156 @@
+"""
+Read routing between the primary and a read replica.
+
+:class:`ReplicaRouter` decides, for each repository read, whether it may go
+to the replica pool. A read goes to the replica only when:
+
+* a replica is configured (``DB_READ_HOST``),
+* the replica's replication lag, sampled at most once per
+  ``DB_REPLICA_LAG_CHECK_SECONDS``, is within ``DB_REPLICA_MAX_LAG_SECONDS``, and
+* nothing the read touches was written recently.
+
+The last rule gives read-your-writes. After a retry, report or flag write,
+or an invalidation from the change feed or another agent, the affected
+transaction and user are pinned to the primary for the staleness tolerance
+plus one lag-check interval. By then any replica that passes the lag check
+has replayed the write.
+
+Environment:
+    DB_REPLICA_MAX_LAG_SECONDS    Replica lag still acceptable for reads (default 2)
+    DB_REPLICA_LAG_CHECK_SECONDS  How often replica lag is sampled (default 1)
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, Optional, Tuple
+
+from .pool import CONNECTION_ERRORS, PRIMARY, REPLICA, replica_configured, with_connection
+
+logger = logging.getLogger(__name__)
+
+# Seconds the replica is behind the primary; 0 when it has replayed
+# everything it received (an idle primary writes no new transactions, so
+# the replay timestamp alone would overstate the lag)
+REPLICA_LAG = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+# Expired pins are swept once this many are held
+_PIN_SWEEP_SIZE = 4096
+
+
+class ReplicaRouter:
+    """Chooses the pool role for each read."""
+
+    def __init__(self, max_lag: float = 2.0, check_interval: float = 1.0):
+        self.enabled = replica_configured()
+        self.max_lag = max_lag
+        self.check_interval = check_interval
+        self._pins: Dict[Tuple[str, str], float] = {}
+        self._all_pinned_until = 0.0
+        self._lag: Optional[float] = None
+        self._lag_checked_at = float("-inf")
+        self.replica_reads = 0
+        self.primary_reads = 0
+        self.pinned_reads = 0
+
+    @property
+    def pin_seconds(self) -> float:
+        return self.max_lag + self.check_interval
+
+    def pin(self, transaction_id: Optional[str] = None, user_id: Optional[str] = None) -> None:
+        """
+        Send reads of ``transaction_id``/``user_id`` to the primary for a while.
+
+        With neither argument every read is pinned.
+        """
+        if not self.enabled:
+            return
+        until = time.monotonic() + self.pin_seconds
+        if transaction_id is None and user_id is None:
+            self._all_pinned_until = until
+            return
+        if len(self._pins) >= _PIN_SWEEP_SIZE:
+            now = time.monotonic()
+            self._pins = {key: expiry for key, expiry in self._pins.items() if expiry > now}
+        if transaction_id is not None:
+            self._pins[("txn", transaction_id)] = until
+        if user_id is not None:
+            self._pins[("user", user_id)] = until
+
+    def _pinned(self, transaction_id: Optional[str], user_id: Optional[str]) -> bool:
+        now = time.monotonic()
+        if self._all_pinned_until > now:
+            return True
+        if transaction_id is not None and self._pins.get(("txn", transaction_id), 0.0) > now:
+            return True
+        return user_id is not None and self._pins.get(("user", user_id), 0.0) > now
+
+    async def replica_lag(self) -> Optional[float]:
+        """Last sampled replica lag in seconds, or None if it is unknown or unreachable."""
+        now = time.monotonic()
+        if now - self._lag_checked_at >= self.check_interval:
+            self._lag_checked_at = now
+            try:
+                self._lag = await with_connection(
+                    lambda conn: conn.fetchval(REPLICA_LAG, timeout=self.check_interval),
+                    role=REPLICA,
+                    name="pool.replica_lag"
+                )
+            except (*CONNECTION_ERRORS, asyncio.TimeoutError) as e:
+                # A probe slower than check_interval counts as unavailable, not as a failed read
+                logger.warning("Read replica unavailable, reading from primary: %r", e)
+                self._lag = None
+        return self._lag
+
+    def mark_unavailable(self) -> None:
+        """Route reads to the primary until the next lag check succeeds."""
+        self._lag = None
+        self._lag_checked_at = time.monotonic()
+
+    async def read_role(
+        self,
+        transaction_id: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> str:
+        """
+        Pool role for a read of ``transaction_id`` and/or ``user_id``'s rows.
+
+        Returns:
+            :data:`~spark_db.pool.REPLICA` or :data:`~spark_db.pool.PRIMARY`
+        """
+        if not self.enabled:
+            return PRIMARY
+        if self._pinned(transaction_id, user_id):
+            self.pinned_reads += 1
+            return PRIMARY
+        lag = await self.replica_lag()
+        if lag is None or lag > self.max_lag:
+            self.primary_reads += 1
+            return PRIMARY
+        self.replica_reads += 1
+        return REPLICA
+
+    def stats(self) -> Dict[str, Any]:
+        """Where reads went and the last sampled lag."""
+        return {
+            "replica_configured": self.enabled,
+            "replica_lag_seconds": self._lag,
+            "replica_reads": self.replica_reads,
+            "primary_reads": self.primary_reads,
+            "pinned_reads": self.pinned_reads,
+        }
+
+
+def create_router() -> ReplicaRouter:
+    """Build a router from the environment."""
+    return ReplicaRouter(
+        float(os.getenv('DB_REPLICA_MAX_LAG_SECONDS') or 2),
+        float(os.getenv('DB_REPLICA_LAG_CHECK_SECONDS') or 1),
+    )
@@ -0,0 +1,137 @@
+"""
+In-process single-flight for duplicate requests.
+
+When the same work is requested again while the first call is still running,
+or shortly after it finished, :class:`SingleFlight` hands the second caller
+the first call's result instead of running the work again. The reconciler
+uses it so that a transaction retried twice, for example by a proactive
+trigger and a chat message arriving together, is retried and escalated once.
+
+Only completed results are kept, for ``ttl`` seconds. A call that raises is
+forgotten once its current waiters have seen the error, so the next request
+runs the work again.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Generic, Hashable, List, Optional, Sequence, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight(Generic[T]):
+    """Shares the result of in-flight and recently finished calls per key."""
+
+    def __init__(self, ttl: float = 30.0):
+        self.ttl = ttl
+        # key -> (result future, monotonic expiry; infinite while in flight)
+        self._calls: Dict[Hashable, Tuple[asyncio.Future, float]] = {}
+        self.calls = 0
+        self.shared = 0
+
+    def _sweep(self, now: float) -> None:
+        expired = [key for key, (_future, expires) in self._calls.items() if expires <= now]
+        for key in expired:
+            del self._calls[key]
+
+    async def run(self, key: Hashable, operation: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Run ``operation`` for ``key`` unless a call for it is running or recent.
+
+        Returns:
+            The result, and whether it came from another caller's call
+        """
+        async def _one(_keys: List[Hashable]) -> Dict[Hashable, T]:
+            return {key: await operation()}
+
+        return (await self.run_many([key], _one))[key]
+
+    async def run_many(
+        self,
+        keys: Sequence[Hashable],
+        operation: Callable[[List[Hashable]], Awaitable[Dict[Hashable, T]]]
+    ) -> Dict[Hashable, Tuple[T, bool]]:
+        """
+        Like :meth:`run` for several keys, with one call for all the keys not
+        already running or recent.
+
+        Args:
+            keys: Keys to get results for
+            operation: Called with the keys this caller has to run; returns a
+                result for each of them. Keys it leaves out raise KeyError.
+
+        Returns:
+            ``(result, shared)`` per key
+        """
+        loop = asyncio.get_running_loop()
+        self._sweep(time.monotonic())
+
+        futures: Dict[Hashable, asyncio.Future] = {}
+        owned: List[Hashable] = []
+        for key in dict.fromkeys(keys):
+            call = self._calls.get(key)
+            if call is None:
+                future = loop.create_future()
+                self._calls[key] = (future, float("inf"))
+                owned.append(key)
+            else:
+                future = call[0]
+                self.shared += 1
+            futures[key] = future
+        self.calls += len(owned)
+
+        if owned:
+            error: Optional[Exception] = None
+            results: Dict[Hashable, T] = {}
+            try:
+                results = await operation(owned)
+            except BaseException as e:
+                error = e if isinstance(e, Exception) else RuntimeError(
+                    "The request being waited on was cancelled"
+                )
+                raise
+            finally:
+                self._settle(owned, futures, results, error)
+
+        owned_keys = set(owned)
+        # Shielded, so a waiter that is cancelled (deadline, client gone)
+        # leaves the shared future, and everyone else waiting on it, alone
+        return {
+            key: (await asyncio.shield(future), key not in owned_keys)
+            for key, future in futures.items()
+        }
+
+    def _settle(
+        self,
+        owned: List[Hashable],
+        futures: Dict[Hashable, asyncio.Future],
+        results: Dict[Hashable, T],
+        error: Optional[Exception]
+    ) -> None:
+        """Resolve the owned futures; keep the results, forget everything else."""
+        expires = time.monotonic() + self.ttl
+        for key in owned:
+            future = futures[key]
+            if not future.done():
+                if error is None and key in results:
+                    future.set_result(results[key])
+                else:
+                    future.set_exception(error or KeyError(
+                        f"The operation returned no result for {key!r}"
+                    ))
+            # exception() also marks a failure retrieved, so waiter-less ones are not logged
+            succeeded = not future.cancelled() and future.exception() is None
+            if self._calls.get(key, (None,))[0] is not future:
+                continue
+            if succeeded:
+                self._calls[key] = (future, expires)
+            else:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, Any]:
+        """Calls run, results shared, and keys currently held."""
+        return {
+            "calls": self.calls,
+            "shared": self.shared,
+            "held": len(self._calls),
+        }
@@ -0,0 +1,394 @@
+"""
+Embedded SQLite stand-in for the Postgres repository.
+
+Selected with ``DB_BACKEND=sqlite``. It implements the same
+:class:`~spark_db.repository.TransactionRepository` semantics (user scoping,
+keyset pages, retry limits, message IDs spliced into reports) without a
+database server, so the agents can be benchmarked and load-tested on a
+single machine. ``DB_SQLITE_PATH`` points it at a file, which both agents
+can share; the default ``:memory:`` database lives only as long as the
+process.
+
+Calls run synchronously on the event loop: local SQLite statements finish
+in microseconds, and running them inline keeps each method atomic with
+respect to other tasks.
+"""
+
+import sqlite3
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from .repository import (
+    MAX_RETRIES,
+    MAX_RETRY_BATCH,
+    RETRY_COLUMNS,
+    TRANSACTION_COLUMNS,
+    TransactionRepository,
+    decode_cursor,
+    encode_cursor,
+    retry_row,
+)
+from .status_events import current_status, legacy_timeline
+
+_BOOLEAN_COLUMNS = {
+    "is_floating_cash",
+    "is_fraudulent_attempt",
+    "is_cancellation",
+    "is_retry_successful",
+    "manual_escalation_needed",
+}
+
+_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS transactions (
+        transaction_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        amount REAL,
+        transaction_type TEXT,
+        recipient_type TEXT,
+        recipient_account_id TEXT,
+        recipient_bank_name_or_ewallet TEXT,
+        device_id TEXT,
+        location_coordinates TEXT,
+        timestamp_initiated TEXT,
+        status_1 TEXT,
+        status_timestamp_1 TEXT,
+        status_2 TEXT,
+        status_timestamp_2 TEXT,
+        status_3 TEXT,
+        status_timestamp_3 TEXT,
+        status_4 TEXT,
+        status_timestamp_4 TEXT,
+        expected_completion_time TEXT,
+        simulated_network_latency REAL,
+        is_floating_cash INTEGER DEFAULT 0,
+        floating_duration_minutes INTEGER DEFAULT 0,
+        is_fraudulent_attempt INTEGER DEFAULT 0,
+        is_cancellation INTEGER DEFAULT 0,
+        is_retry_successful INTEGER DEFAULT 0,
+        manual_escalation_needed INTEGER DEFAULT 0,
+        transaction_types TEXT,
+        parent_transaction_id TEXT,
+        retry_number INTEGER,
+        current_status TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_transactions_user_history
+        ON transactions (user_id, timestamp_initiated DESC, transaction_id DESC);
+    CREATE UNIQUE INDEX IF NOT EXISTS idx_transactions_retry_lineage
+        ON transactions (parent_transaction_id, retry_number)
+        WHERE parent_transaction_id IS NOT NULL;
+    CREATE TABLE IF NOT EXISTS messages (
+        message_id INTEGER PRIMARY KEY AUTOINCREMENT,
+        transaction_id TEXT NOT NULL,
+        report TEXT
+    );
+    CREATE INDEX IF NOT EXISTS idx_messages_transaction
+        ON messages (transaction_id, message_id DESC);
+"""
+
+_SELECT = f"SELECT {', '.join(TRANSACTION_COLUMNS)} FROM transactions"
+_ORDER = "ORDER BY timestamp_initiated DESC, transaction_id DESC"
+
+
+def _as_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    # SQLite has no boolean type; hand back what Postgres would
+    result = dict(row)
+    for column in _BOOLEAN_COLUMNS.intersection(result):
+        if result[column] is not None:
+            result[column] = bool(result[column])
+    return result
+
+
+def _as_text(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+class SQLiteTransactionRepository(TransactionRepository):
+    """Repository backed by an embedded SQLite database."""
+
+    def __init__(self, path: str = ":memory:"):
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode = WAL")
+        self._conn.execute("PRAGMA busy_timeout = 5000")
+        self._conn.executescript(_SCHEMA)
+        columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(transactions)")}
+        if "current_status" not in columns:
+            # Database file created before current_status existed
+            self._conn.execute("ALTER TABLE transactions ADD COLUMN current_status TEXT")
+            self._conn.execute(
+                "UPDATE transactions SET current_status = "
+                "COALESCE(status_4, status_3, status_2, status_1)"
+            )
+
+    def load_transactions(self, rows: Iterable[Mapping[str, Any]]) -> int:
+        """
+        Insert or replace transactions, e.g. to seed a benchmark.
+
+        Args:
+            rows: Mappings with any of the transaction and lineage columns
+
+        Returns:
+            Number of rows written
+        """
+        count = 0
+        self._conn.execute("BEGIN")
+        try:
+            for row in rows:
+                if not row.get("current_status"):
+                    row = {**row, "current_status": current_status(row)}
+                columns = [column for column in RETRY_COLUMNS if column in row]
+                self._conn.execute(
+                    f"INSERT OR REPLACE INTO transactions ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' for _ in columns)})",
+                    [_as_text(row[column]) for column in columns]
+                )
+                count += 1
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return count
+
+    def _fetchone(self, transaction_id: str, user_id: Optional[str]) -> Optional[sqlite3.Row]:
+        if user_id:
+            return self._conn.execute(
+                f"{_SELECT} WHERE transaction_id = ? AND user_id = ?", (transaction_id, user_id)
+            ).fetchone()
+        return self._conn.execute(f"{_SELECT} WHERE transaction_id = ?", (transaction_id,)).fetchone()
+
+    async def get_transaction(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        row = self._fetchone(transaction_id, user_id)
+        return _as_dict(row) if row else None
+
+    async def get_transactions(
+        self,
+        transaction_ids: Sequence[str],
+        user_id: str
+    ) -> List[Dict[str, Any]]:
+        if not transaction_ids:
+            return []
+
+        placeholders = ", ".join("?" for _ in transaction_ids)
+        rows = self._conn.execute(
+            f"{_SELECT} WHERE transaction_id IN ({placeholders}) AND user_id = ?",
+            (*transaction_ids, user_id)
+        ).fetchall()
+        by_id = {row["transaction_id"]: _as_dict(row) for row in rows}
+        return [by_id[txn_id] for txn_id in transaction_ids if txn_id in by_id]
+
+    async def get_transaction_context(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None,
+        report_limit: int = 5
+    ) -> Optional[Dict[str, Any]]:
+        row = self._fetchone(transaction_id, user_id)
+        if row is None:
+            return None
+
+        retries = self._conn.execute(
+            f"{_SELECT} WHERE parent_transaction_id = ? ORDER BY retry_number",
+            (transaction_id,)
+        ).fetchall()
+        reports = self._conn.execute(
+            """
+            SELECT message_id, substr(report, 1, 500) AS report_preview
+            FROM messages
+            WHERE transaction_id = ?
+            ORDER BY message_id DESC
+            LIMIT ?
+            """,
+            (transaction_id, report_limit)
+        ).fetchall()
+        return {
+            "transaction": _as_dict(row),
+            "retry_attempts": [_as_dict(retry) for retry in retries],
+            "retry_count": len(retries),
+            "report_previews": [dict(report) for report in reports],
+            # No events table here; the legacy columns hold the whole timeline
+            "status_timeline": legacy_timeline(_as_dict(row)),
+        }
+
+    async def list_user_transactions(
+        self,
+        user_id: str,
+        limit: int,
+        cursor: Optional[str] = None
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        if cursor:
+            timestamp, transaction_id = decode_cursor(cursor)
+            rows = self._conn.execute(
+                f"{_SELECT} WHERE user_id = ? AND (timestamp_initiated, transaction_id) < (?, ?) "
+                f"{_ORDER} LIMIT ?",
+                (user_id, timestamp, transaction_id, limit + 1)
+            ).fetchall()
+        else:
+            rows = self._conn.execute(
+                f"{_SELECT} WHERE user_id = ? {_ORDER} LIMIT ?", (user_id, limit + 1)
+            ).fetchall()
+
+        page = [_as_dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(page[-1]) if len(rows) > limit else None
+        return page, next_cursor
+
+    async def stream_user_transactions(
+        self,
+        user_id: str,
+        prefetch: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        rows = self._conn.execute(f"{_SELECT} WHERE user_id = ? {_ORDER}", (user_id,))
+        while True:
+            batch = rows.fetchmany(prefetch)
+            if not batch:
+                break
+            for row in batch:
+                yield _as_dict(row)
+
+    async def flag_floating_cash(
+        self,
+        transaction_id: str,
+        user_id: str,
+        floating_duration_minutes: int
+    ) -> bool:
+        updated = self._conn.execute(
+            """
+            UPDATE transactions
+            SET is_floating_cash = 1,
+                floating_duration_minutes = ?
+            WHERE transaction_id = ? AND user_id = ?
+            """,
+            (floating_duration_minutes, transaction_id, user_id)
+        ).rowcount
+        return updated > 0
+
+    async def flag_floating_cash_many(
+        self,
+        flags: Sequence[Tuple[str, str, int]]
+    ) -> int:
+        if not flags:
+            return 0
+        self._conn.execute("BEGIN")
+        try:
+            updated = self._conn.executemany(
+                """
+                UPDATE transactions
+                SET is_floating_cash = 1,
+                    floating_duration_minutes = ?
+                WHERE transaction_id = ? AND user_id = ?
+                """,
+                [(duration, transaction_id, user_id) for transaction_id, user_id, duration in flags]
+            ).rowcount
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return updated
+
+    async def create_retry(
+        self,
+        transaction_id: str,
+        user_id: Optional[str] = None
+    ) -> Dict[str, Any]:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            result = self._create_retry(transaction_id, user_id)
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return result
+
+    async def create_retries(
+        self,
+        transaction_ids: Sequence[str],
+        user_id: Optional[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        transaction_ids = list(dict.fromkeys(transaction_ids))
+        if len(transaction_ids) > MAX_RETRY_BATCH:
+            raise ValueError(f"At most {MAX_RETRY_BATCH} transactions can be retried at once")
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            results = {
+                transaction_id: self._create_retry(transaction_id, user_id)
+                for transaction_id in transaction_ids
+            }
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return results
+
+    def _create_retry(self, transaction_id: str, user_id: Optional[str]) -> Dict[str, Any]:
+        original = self._fetchone(transaction_id, user_id)
+        if original is None:
+            return {"status": "not_found"}
+        if not original["is_floating_cash"]:
+            return {"status": "no_discrepancy"}
+        if original["is_retry_successful"]:
+            return {"status": "already_resolved"}
+
+        retry_count = self._conn.execute(
+            "SELECT COUNT(*) FROM transactions WHERE parent_transaction_id = ?",
+            (transaction_id,)
+        ).fetchone()[0]
+        if retry_count >= MAX_RETRIES:
+            return {"status": "limit_reached", "retry_count": retry_count}
+
+        now = datetime.now()
+        row = retry_row(_as_dict(original), retry_count + 1, now)
+        self._conn.execute(
+            f"INSERT INTO transactions ({', '.join(RETRY_COLUMNS)}) "
+            f"VALUES ({', '.join('?' for _ in RETRY_COLUMNS)})",
+            [row[column] for column in RETRY_COLUMNS]
+        )
+        self._conn.execute(
+            """
+            UPDATE transactions
+            SET is_retry_successful = 1,
+                manual_escalation_needed = 0
+            WHERE transaction_id = ?
+            """,
+            (transaction_id,)
+        )
+        return {
+            "status": "success",
+            "user_id": row["user_id"],
+            "new_transaction_id": row["transaction_id"],
+            "retry_number": row["retry_number"],
+            "timestamp": now.isoformat(),
+        }
+
+    async def save_report(
+        self,
+        transaction_id: str,
+        report_prefix: str,
+        report_suffix: str,
+        escalate: bool
+    ) -> int:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            message_id = self._conn.execute(
+                "INSERT INTO messages (transaction_id, report) VALUES (?, '')",
+                (transaction_id,)
+            ).lastrowid
+            self._conn.execute(
+                "UPDATE messages SET report = ? WHERE message_id = ?",
+                (f"{report_prefix}{message_id}{report_suffix}", message_id)
+            )
+            if escalate:
+                self._conn.execute(
+                    "UPDATE transactions SET manual_escalation_needed = 1 WHERE transaction_id = ?",
+                    (transaction_id,)
+                )
+            self._conn.execute("COMMIT")
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+        return message_id
+
+    async def close(self) -> None:
+        self._conn.close()
@@ -0,0 +1,281 @@
+"""
+Transaction status history for the ``transactions`` table.
+
+Every status a transaction passes through is appended to
+``transaction_status_events``, which is indexed by ``(transaction_id, ts)``
+for a transaction's timeline and by ``(status, ts)`` for questions like
+"what entered processing before 10:00". The latest status is kept in
+``transactions.current_status``, so readers no longer guess it from
+``status_4``-or-``status_1`` fallbacks.
+
+The legacy ``status_n``/``status_timestamp_n`` column pairs stay in sync
+both ways, so existing readers and writers keep working:
+
+* writing a ``status_n`` pair (inserts, retries, bulk loads) appends an event
+  for each pair that changed and updates ``current_status``
+* appending an event directly fills the next empty ``status_n`` pair, or
+  replaces ``status_4`` once all four are taken
+
+Usage:
+    python -m spark_db.status_events [--batch-size N] [--start-after TRANSACTION_ID]
+
+Adds the table, column and triggers if missing (migration 8 in
+``spark_db.migrations`` does the same), then backfills events and
+``current_status`` for transactions written before the triggers existed.
+The backfill commits per batch and skips transactions that already have
+events, so it can be interrupted and rerun at any point; ``--start-after``
+skips keys that a previous run already walked past.
+"""
+
+import argparse
+import asyncio
+import logging
+from typing import Any, Dict, List, Mapping, Optional
+
+from .pool import close_pool, with_connection
+
+logger = logging.getLogger(__name__)
+
+# The legacy slots, oldest first
+STATUS_SLOTS = [(f"status_{n}", f"status_timestamp_{n}") for n in range(1, 5)]
+
+# Latest legacy status of a row aliased ``t``
+LEGACY_CURRENT_STATUS = "COALESCE(t.status_4, t.status_3, t.status_2, t.status_1)"
+
+_LEGACY_EVENTS = " UNION ALL ".join(
+    f"SELECT {n} AS step, NEW.status_{n} AS status, NEW.status_timestamp_{n} AS ts"
+    for n in range(1, 5)
+)
+
+_CHANGED_SLOT = " OR ".join(
+    f"(e.step = {n} AND (NEW.status_{n}, NEW.status_timestamp_{n}) "
+    f"IS DISTINCT FROM (OLD.status_{n}, OLD.status_timestamp_{n}))"
+    for n in range(1, 5)
+)
+
+_HELD_IN_SLOT = " OR ".join(
+    f"(status_{n}, status_timestamp_{n}) IS NOT DISTINCT FROM (NEW.status, NEW.ts)"
+    for n in range(1, 5)
+)
+
+STATUS_EVENTS_DDL = [
+    "ALTER TABLE transactions ADD COLUMN IF NOT EXISTS current_status TEXT",
+    """
+    CREATE TABLE IF NOT EXISTS transaction_status_events (
+        event_id BIGINT GENERATED ALWAYS AS IDENTITY PRIMARY KEY,
+        transaction_id TEXT NOT NULL REFERENCES transactions ON DELETE CASCADE,
+        status TEXT NOT NULL,
+        ts TIMESTAMP
+    )
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_status_events_transaction
+        ON transaction_status_events (transaction_id, ts)
+    """,
+    """
+    CREATE INDEX IF NOT EXISTS idx_status_events_status
+        ON transaction_status_events (status, ts)
+    """,
+    # current_status follows the legacy columns on every write
+    """
+    CREATE OR REPLACE FUNCTION spark_set_current_status() RETURNS trigger AS $$
+    BEGIN
+        NEW.current_status := COALESCE(NEW.status_4, NEW.status_3, NEW.status_2, NEW.status_1);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS transactions_current_status ON transactions",
+    """
+    CREATE TRIGGER transactions_current_status
+        BEFORE INSERT OR UPDATE OF status_1, status_2, status_3, status_4 ON transactions
+        FOR EACH ROW EXECUTE FUNCTION spark_set_current_status()
+    """,
+    # Legacy writes append one event per new or changed status_n pair. Writes
+    # made by spark_status_event_to_legacy (trigger depth 2) already have theirs.
+    f"""
+    CREATE OR REPLACE FUNCTION spark_status_events_from_legacy() RETURNS trigger AS $$
+    BEGIN
+        IF pg_trigger_depth() > 1 THEN
+            RETURN NULL;
+        END IF;
+        INSERT INTO transaction_status_events (transaction_id, status, ts)
+        SELECT NEW.transaction_id, e.status, e.ts
+        FROM ({_LEGACY_EVENTS}) e
+        WHERE e.status IS NOT NULL
+          AND (TG_OP = 'INSERT' OR {_CHANGED_SLOT})
+        ORDER BY e.step;
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS transactions_status_events ON transactions",
+    """
+    CREATE TRIGGER transactions_status_events
+        AFTER INSERT OR UPDATE OF status_1, status_2, status_3, status_4, status_timestamp_1,
+            status_timestamp_2, status_timestamp_3, status_timestamp_4 ON transactions
+        FOR EACH ROW EXECUTE FUNCTION spark_status_events_from_legacy()
+    """,
+    # Events appended directly go into the next empty slot, or status_4 once
+    # all slots are taken (SET expressions all see the row before the update).
+    # Events a slot already holds, such as backfilled ones, change nothing.
+    f"""
+    CREATE OR REPLACE FUNCTION spark_status_event_to_legacy() RETURNS trigger AS $$
+    BEGIN
+        IF pg_trigger_depth() > 1 THEN
+            RETURN NULL;
+        END IF;
+        UPDATE transactions SET
+            status_1 = CASE WHEN status_1 IS NULL THEN NEW.status ELSE status_1 END,
+            status_timestamp_1 = CASE WHEN status_1 IS NULL THEN NEW.ts ELSE status_timestamp_1 END,
+            status_2 = CASE WHEN status_1 IS NOT NULL AND status_2 IS NULL
+                            THEN NEW.status ELSE status_2 END,
+            status_timestamp_2 = CASE WHEN status_1 IS NOT NULL AND status_2 IS NULL
+                                      THEN NEW.ts ELSE status_timestamp_2 END,
+            status_3 = CASE WHEN status_2 IS NOT NULL AND status_3 IS NULL
+                            THEN NEW.status ELSE status_3 END,
+            status_timestamp_3 = CASE WHEN status_2 IS NOT NULL AND status_3 IS NULL
+                                      THEN NEW.ts ELSE status_timestamp_3 END,
+            status_4 = CASE WHEN status_3 IS NOT NULL THEN NEW.status ELSE status_4 END,
+            status_timestamp_4 = CASE WHEN status_3 IS NOT NULL THEN NEW.ts ELSE status_timestamp_4 END
+        WHERE transaction_id = NEW.transaction_id
+          AND NOT ({_HELD_IN_SLOT});
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS status_events_to_legacy ON transaction_status_events",
+    """
+    CREATE TRIGGER status_events_to_legacy
+        AFTER INSERT ON transaction_status_events
+        FOR EACH ROW EXECUTE FUNCTION spark_status_event_to_legacy()
+    """,
+]
+
+# A transaction's events, oldest first
+STATUS_TIMELINE_ORDER = "ORDER BY ts NULLS LAST, event_id"
+
+_BACKFILL_BATCH = f"""
+    WITH batch AS (
+        SELECT transaction_id
+        FROM transactions
+        WHERE transaction_id > $1
+        ORDER BY transaction_id
+        LIMIT $2
+    ), pending AS (
+        SELECT t.*
+        FROM transactions t
+        JOIN batch USING (transaction_id)
+        WHERE NOT EXISTS (
+            SELECT 1 FROM transaction_status_events e
+            WHERE e.transaction_id = t.transaction_id
+        )
+    ), inserted AS (
+        INSERT INTO transaction_status_events (transaction_id, status, ts)
+        SELECT t.transaction_id, slot.status, slot.ts
+        FROM pending t
+        CROSS JOIN LATERAL (VALUES
+            (1, t.status_1, t.status_timestamp_1),
+            (2, t.status_2, t.status_timestamp_2),
+            (3, t.status_3, t.status_timestamp_3),
+            (4, t.status_4, t.status_timestamp_4)
+        ) AS slot(step, status, ts)
+        WHERE slot.status IS NOT NULL
+        ORDER BY t.transaction_id, slot.step
+        RETURNING 1
+    ), updated AS (
+        UPDATE transactions t
+        SET current_status = {LEGACY_CURRENT_STATUS}
+        FROM batch
+        WHERE t.transaction_id = batch.transaction_id
+          AND t.current_status IS DISTINCT FROM {LEGACY_CURRENT_STATUS}
+        RETURNING 1
+    )
+    SELECT (SELECT max(transaction_id) FROM batch) AS last_id,
+           (SELECT count(*) FROM inserted) AS events,
+           (SELECT count(*) FROM updated) AS updated
+"""
+
+
+def current_status(row: Mapping[str, Any]) -> Optional[str]:
+    """
+    Latest status of a transaction row.
+
+    ``current_status`` when the row has it, else the latest legacy status
+    (rows the backfill has not reached yet, or the SQLite backend).
+    """
+    status = row.get("current_status")
+    if status:
+        return status
+    for status_column, _timestamp_column in reversed(STATUS_SLOTS):
+        if row.get(status_column):
+            return row[status_column]
+    return None
+
+
+def legacy_timeline(row: Mapping[str, Any]) -> List[Dict[str, Any]]:
+    """Status events of a transaction row rebuilt from its legacy columns, oldest first."""
+    return [
+        {"status": row[status_column], "ts": row.get(timestamp_column)}
+        for status_column, timestamp_column in STATUS_SLOTS
+        if row.get(status_column)
+    ]
+
+
+async def ensure_status_events_schema(conn) -> None:
+    """Add the events table, ``current_status`` and the sync triggers if missing."""
+    for statement in STATUS_EVENTS_DDL:
+        await conn.execute(statement)
+
+
+async def backfill_status_events(batch_size: int = 1000, start_after: str = "") -> int:
+    """
+    Append events and set ``current_status`` for rows written before migration 8.
+
+    Walks the primary key in batches, each committed on its own, so progress
+    survives an interruption. Backfilled rows are not sent to the change feed.
+
+    Args:
+        batch_size: Primary keys examined per batch
+        start_after: Resume after this transaction ID
+
+    Returns:
+        Number of events appended
+    """
+    # Imported here: changes imports the repository, which imports this module
+    from .changes import SUPPRESS_SETTING
+
+    async def _batch(conn, last_id: str):
+        async with conn.transaction():
+            await conn.execute(f"SET LOCAL {SUPPRESS_SETTING} = 'on'")
+            return await conn.fetchrow(_BACKFILL_BATCH, last_id, batch_size)
+
+    total = 0
+    last_id = start_after
+    while True:
+        row = await with_connection(lambda conn: _batch(conn, last_id))
+        if row is None or row['last_id'] is None:
+            break
+        last_id = row['last_id']
+        total += row['events']
+        logger.info("Backfilled %d status events (through %s)", total, last_id)
+    return total
+
+
+async def _main(batch_size: int, start_after: str) -> None:
+    try:
+        await with_connection(ensure_status_events_schema)
+        total = await backfill_status_events(batch_size, start_after)
+        print(f"Status events backfill complete: {total} events appended")
+    finally:
+        await close_pool()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Add and backfill transaction status events")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--start-after", default="", help="Resume after this transaction ID")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    asyncio.run(_main(args.batch_size, args.start_after))
@@ -0,0 +1,175 @@
+"""
+Write-behind queue for floating-cash flags.
+
+``run_discrepancy_check`` used to wait for its ``UPDATE`` to commit before
+returning a verdict, so every check paid a database round trip that the
+verdict does not depend on. :class:`FlagWriteBehind` takes the flag instead,
+coalesces it with any pending flag for the same transaction, and writes the
+whole batch with one ``flag_floating_cash_many`` call (``UNNEST`` on
+Postgres, ``executemany`` on SQLite) once the batch is full or has waited
+long enough. Pending flags are flushed on shutdown, and callers that need the
+flags to be visible to another process (e.g. before handing a transaction to
+the reconciler) can ``await flush()``.
+
+The background flusher runs outside any request's context, so it never
+inherits the deadline of the request whose flag started it.
+
+Environment:
+    DB_FLAG_BATCH_SIZE      Pending transactions that trigger a flush (default 100)
+    DB_FLAG_FLUSH_SECONDS   Longest a flag waits before it is written (default 0.5)
+"""
+
+import asyncio
+import contextvars
+import logging
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from .repository import TransactionRepository, get_repository
+
+logger = logging.getLogger(__name__)
+
+# Failed batches are retried on later flushes before the flags are dropped
+_MAX_ATTEMPTS = 3
+
+
+class FlagWriteBehind:
+    """Coalescing, batched writer for ``flag_floating_cash``."""
+
+    def __init__(
+        self,
+        repository: TransactionRepository,
+        batch_size: int = 100,
+        flush_seconds: float = 0.5
+    ):
+        self.repository = repository
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        # transaction_id -> (user_id, floating_duration_minutes, attempts)
+        self._pending: Dict[str, Tuple[str, int, int]] = {}
+        self._has_pending = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.failures = 0
+        self.dropped = 0
+
+    def submit(self, transaction_id: str, user_id: str, floating_duration_minutes: int) -> None:
+        """
+        Queue a floating-cash flag without waiting for it to be written.
+
+        A later flag for the same transaction replaces a pending one.
+        """
+        self.submitted += 1
+        if transaction_id in self._pending:
+            self.coalesced += 1
+        self._pending[transaction_id] = (user_id, floating_duration_minutes, 0)
+        self._has_pending.set()
+        if len(self._pending) >= self.batch_size:
+            self._batch_full.set()
+        self._ensure_running()
+
+    def _ensure_running(self) -> None:
+        if self._task is None or self._task.done():
+            # Created in an empty context: a task copies the current one, which
+            # here belongs to the request that submitted the first flag
+            self._task = contextvars.Context().run(
+                asyncio.create_task, self._run(), name="spark-flag-write-behind"
+            )
+
+    async def _run(self) -> None:
+        while True:
+            await self._has_pending.wait()
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self) -> int:
+        """
+        Write every pending flag now.
+
+        Returns:
+            Number of rows updated
+        """
+        async with self._flush_lock:
+            batch, self._pending = self._pending, {}
+            self._has_pending.clear()
+            self._batch_full.clear()
+            if not batch:
+                return 0
+
+            try:
+                updated = await self.repository.flag_floating_cash_many([
+                    (transaction_id, user_id, minutes)
+                    for transaction_id, (user_id, minutes, _attempts) in batch.items()
+                ])
+            except Exception as e:
+                self.failures += 1
+                self._requeue(batch)
+                logger.warning("Failed to write %d floating-cash flags: %s", len(batch), e)
+                return 0
+
+            self.flushes += 1
+            self.rows_written += updated
+            return updated
+
+    def _requeue(self, batch: Dict[str, Tuple[str, int, int]]) -> None:
+        for transaction_id, (user_id, minutes, attempts) in batch.items():
+            if transaction_id in self._pending:
+                # Superseded by a newer flag while the batch was in flight
+                continue
+            if attempts + 1 >= _MAX_ATTEMPTS:
+                self.dropped += 1
+                logger.error("Dropping floating-cash flag for %s after %d attempts",
+                             transaction_id, attempts + 1)
+                continue
+            self._pending[transaction_id] = (user_id, minutes, attempts + 1)
+        if self._pending:
+            self._has_pending.set()
+
+    async def close(self) -> None:
+        """Stop the background flusher and write whatever is still pending."""
+        if self._task is not None:
+            # Never cancel a batch halfway through its write
+            async with self._flush_lock:
+                self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth and write counters."""
+        return {
+            "pending": len(self._pending),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failures": self.failures,
+            "dropped": self.dropped,
+        }
+
+
+_flag_writer: Optional[FlagWriteBehind] = None
+
+
+def get_flag_writer() -> FlagWriteBehind:
+    """Return the process-wide flag writer for :func:`get_repository`."""
+    global _flag_writer
+    if _flag_writer is None:
+        _flag_writer = FlagWriteBehind(
+            get_repository(),
+            int(os.getenv('DB_FLAG_BATCH_SIZE') or 100),
+            float(os.getenv('DB_FLAG_FLUSH_SECONDS') or 0.5),
+        )
+    return _flag_writer
+